@@ -38,11 +38,12 @@ from routers import (
     auth_router,
     session_router,
     store_router,
-    lawyer_router
+    lawyer_router,
+    get_current_user
 )
 
-# Import SMS router
-from sms.sms_router import router as sms_router
+# Import SMS routers
+from sms.sms_router import router as sms_router, media_router as sms_media_router
 
 # Import new focused CardGenerator routers (replacing monolithic cardgenerator_router)
 from routers.card_generation_router import router as card_generation_router
@@ -156,6 +157,13 @@ app.include_router(
     tags=["sms"]
 )
 
+app.include_router(
+    sms_media_router,
+    prefix="/api/sms",
+    tags=["sms"],
+    dependencies=[Depends(get_current_user)]
+)
+
 # Register new focused CardGenerator routers (replacing monolithic cardgenerator_router)
 app.include_router(
     card_generation_router,
@@ -3,7 +3,7 @@ from fastapi import HTTPException
 import os
 from dotenv import load_dotenv
 import logging
-from typing import Union
+from typing import Optional, Union
 from fastapi import UploadFile
 
 load_dotenv(dotenv_path='../.env')
@@ -15,16 +15,62 @@ cloudflare_api_token = os.getenv('CLOUDFLARE_IMAGES_API_TOKEN')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client for the Cloudflare Images API (keeps connections warm across uploads)
+CF_HTTP: Optional[httpx.AsyncClient] = None
 
-async def upload_image_to_cloudflare(image_input: Union[str, UploadFile]):
-    logger.info("Uploading image to Cloudflare")
+
+def get_cf_http() -> httpx.AsyncClient:
+    """Return the shared Cloudflare HTTP client, creating it on first use"""
+    global CF_HTTP
+    if CF_HTTP is None or CF_HTTP.is_closed:
+        CF_HTTP = httpx.AsyncClient(timeout=30.0)
+    return CF_HTTP
+
+
+async def close_cf_http():
+    """Close the shared Cloudflare HTTP client on application shutdown"""
+    if CF_HTTP is not None and not CF_HTTP.is_closed:
+        await CF_HTTP.aclose()
+
+
+# Cloudflare Images rejects files over 10 MB, so a re-upload never needs to buffer more than that
+CLOUDFLARE_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Cloudflare answers a URL it could not fetch with a 4xx; these 4xx mean something else and
+# would fail the same way on a re-upload (bad token, rate limited, too large)
+_NO_REUPLOAD_STATUSES = frozenset({401, 403, 413, 429})
+
+
+async def _post_to_cloudflare(files: dict) -> str:
+    """POST a multipart form to Cloudflare Images and return the public variant URL"""
     url = f"https://api.cloudflare.com/client/v4/accounts/{cloudflare_account_id}/images/v1"
     headers = {
         "Authorization": f"Bearer {cloudflare_api_token}",
     }
-    
+
+    response = await get_cf_http().post(url, headers=headers, files=files)
+
+    if response.status_code != 200:
+        error_text = response.text
+        raise HTTPException(status_code=response.status_code, detail=f"Cloudflare API error: {error_text}")
+
+    result = response.json()["result"]
+    public_url = result.get("variants")[0]
+
+    # Ensure URL ends with /public
+    if not public_url.endswith('/public'):
+        public_url = '/'.join(public_url.split('/')[:-1]) + '/public'
+
+    logger.info(f"Image uploaded successfully. Public URL: {public_url}")
+    return public_url
+
+
+async def upload_image_to_cloudflare(image_input: Union[str, UploadFile]):
+    logger.info("Uploading image to Cloudflare")
+
     # Check if input is a URL or UploadFile
     if isinstance(image_input, str):
+        # Cloudflare fetches the source URL itself, so the image never passes through this server
         files = {
             'url': (None, image_input),
             'metadata': (None, '{"key":"value"}'),
@@ -38,20 +84,42 @@ async def upload_image_to_cloudflare(image_input: Union[str, UploadFile]):
             'metadata': (None, '{"key":"value"}'),
             'requireSignedURLs': (None, 'false')
         }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, headers=headers, files=files)
-        
-        if response.status_code != 200:
-            error_text = response.text
-            raise HTTPException(status_code=response.status_code, detail=f"Cloudflare API error: {error_text}")
-        
-        result = response.json()["result"]
-        public_url = result.get("variants")[0]
-        
-        # Ensure URL ends with /public
-        if not public_url.endswith('/public'):
-            public_url = '/'.join(public_url.split('/')[:-1]) + '/public'
-            
-        logger.info(f"Image uploaded successfully. Public URL: {public_url}")
-        return public_url
\ No newline at end of file
+
+    return await _post_to_cloudflare(files)
+
+
+async def upload_image_bytes_to_cloudflare(file_content: bytes, filename: str = "image.png", content_type: str = "image/png"):
+    """Upload raw image bytes to Cloudflare Images"""
+    logger.info("Uploading image bytes to Cloudflare")
+    files = {
+        'file': (filename, file_content, content_type),
+        'metadata': (None, '{"key":"value"}'),
+        'requireSignedURLs': (None, 'false')
+    }
+    return await _post_to_cloudflare(files)
+
+
+async def copy_image_url_to_cloudflare(image_url: str):
+    """
+    Copy a remote image into Cloudflare Images.
+
+    Asks Cloudflare to fetch the URL directly; only if Cloudflare reports that it could not
+    fetch the source (a 4xx fetch error) is the image downloaded here, up to
+    CLOUDFLARE_MAX_IMAGE_BYTES, and re-uploaded. Auth, rate-limit and 5xx errors are raised.
+    """
+    try:
+        return await upload_image_to_cloudflare(image_url)
+    except HTTPException as fetch_error:
+        if not 400 <= fetch_error.status_code < 500 or fetch_error.status_code in _NO_REUPLOAD_STATUSES:
+            raise
+        logger.warning(f"Cloudflare could not fetch {image_url} directly, re-uploading bytes: {fetch_error.detail}")
+
+    async with get_cf_http().stream("GET", image_url) as source:
+        source.raise_for_status()
+        content_type = source.headers.get("content-type", "image/png")
+        content = bytearray()
+        async for chunk in source.aiter_bytes():
+            content += chunk
+            if len(content) > CLOUDFLARE_MAX_IMAGE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Image at {image_url} exceeds {CLOUDFLARE_MAX_IMAGE_BYTES} bytes")
+    return await upload_image_bytes_to_cloudflare(bytes(content), content_type=content_type)
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from pydantic import BaseModel
 import logging
-from ruleslawyer.ruleslawyer_helper import EmbeddingLoader, generate_bot_response
-from openai import OpenAI
+from ruleslawyer.ruleslawyer_helper import EmbeddingLoader, QueryEmbeddingBatcher, get_embedding_loader, generate_bot_response, stream_bot_response
+from openai import AsyncOpenAI
 import os
 from pathlib import Path
 
@@ -17,7 +18,7 @@ RULESLAWYER_DIR = Path(__file__).parent
 # Global variables for single embedding set
 current_embeddings = None
 current_pages_and_chunks = None
-openai_client = OpenAI()
+openai_client = AsyncOpenAI()
 SYSTEM_PROMPT = """You are a friendly and technical answering system, answering questions with accurate, grounded, descriptive, clear, and specific responses. ALWAYS provide a page number citation. Provide a story example. Avoid extraneous details and focus on direct answers. Use the examples provided as a guide for style and brevity. When responding:
 
     1. Identify the key point of the query.
@@ -51,7 +52,7 @@ class RulesLawyerService:
         self.loader: Optional[EmbeddingLoader] = None
     
     def load_embeddings(self, embeddings_file_path: str, enhanced_json_path: str) -> None:
-        self.loader = EmbeddingLoader(
+        self.loader = get_embedding_loader(
             embeddings_file_path=os.path.join(RULESLAWYER_DIR, embeddings_file_path.lstrip('./')),
             enhanced_json_path=os.path.join(RULESLAWYER_DIR, enhanced_json_path.lstrip('./'))
         )
@@ -63,6 +64,8 @@ class RulesLawyerService:
 
 # Create a single instance of the service
 rules_lawyer_service = RulesLawyerService()
+# Concurrent /query requests share one embedding call
+query_embedding_batcher = QueryEmbeddingBatcher()
 
 # Health Check
 @router.get("/health")
@@ -86,14 +89,40 @@ async def load_embedding(request: EmbeddingRequest):
 async def query_rules(request: QueryRequest):
     try:
         loader = rules_lawyer_service.get_loader()
-        response, history = generate_bot_response(
+        query_embedding = await query_embedding_batcher.embed(request.message)
+        response, history = await generate_bot_response(
             message=request.message,
             chat_history=request.chat_history,
             embeddings_loader=loader,
             client=openai_client,
-            system_prompt=SYSTEM_PROMPT
+            system_prompt=SYSTEM_PROMPT,
+            query_embedding=query_embedding
         )
         return {"response": response, "chat_history": history}
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to process query")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to process query")
+
+
+@router.post("/query/stream")
+async def query_rules_stream(request: QueryRequest):
+    """Same as /query, but streams the answer as plain text while it is generated"""
+    try:
+        loader = rules_lawyer_service.get_loader()
+        query_embedding = await query_embedding_batcher.embed(request.message)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to process query")
+
+    return StreamingResponse(
+        stream_bot_response(
+            message=request.message,
+            embeddings_loader=loader,
+            client=openai_client,
+            system_prompt=SYSTEM_PROMPT,
+            query_embedding=query_embedding
+        ),
+        media_type="text/plain"
+    )
@@ -3,11 +3,23 @@ FastAPI router for StatBlock Generator API endpoints
 """
 
 from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from pydantic import ValidationError
 import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime
+import asyncio
 import json
 import time
+import uuid
+import hashlib
+import orjson
+from cachetools import TTLCache
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from operator import itemgetter
 
 # Import authentication
 from .auth_router import get_current_user, get_current_user_optional
@@ -15,6 +27,7 @@ from auth_service import User
 
 # Import StatBlock components
 from statblockgenerator.statblock_generator import StatBlockGenerator
+from statblockgenerator._normalize import normalize_statblock_ids
 from statblockgenerator.models.statblock_models import (
     CreatureGenerationRequest,
     ImageGenerationRequest,
@@ -36,7 +49,7 @@ from google.cloud import firestore
 import os
 import fal_client
 from openai import OpenAI
-from cloudflare.handle_images import upload_image_to_cloudflare
+from cloudflare.handle_images import upload_image_to_cloudflare, copy_image_url_to_cloudflare, get_cf_http, close_cf_http
 
 # Initialize OpenAI client
 openai_client = OpenAI()
@@ -44,7 +57,13 @@ openai_client = OpenAI()
 logger = logging.getLogger(__name__)
 
 # Initialize router
-router = APIRouter(prefix="/api/statblockgenerator", tags=["statblockgenerator"])
+router = APIRouter(
+    prefix="/api/statblockgenerator",
+    tags=["statblockgenerator"],
+    default_response_class=ORJSONResponse  # statblock payloads are large nested dicts
+)
+# The pooled Cloudflare client is shared by every router that uploads images; close it once on shutdown
+router.add_event_handler("shutdown", close_cf_http)
 
 # Global StatBlock generator instance
 statblock_generator = StatBlockGenerator()
@@ -54,6 +73,116 @@ STATBLOCK_SESSIONS_COLLECTION = "statblock_sessions"
 STATBLOCK_PROJECTS_COLLECTION = "statblock_projects"
 STATBLOCK_CREATURES_COLLECTION = "statblock_creatures"
 
+# Fields returned by /list-projects?summary=true
+PROJECT_SUMMARY_FIELDS = ["id", "name", "description", "createdBy", "createdAt", "updatedAt", "lastModified", "metadata"]
+
+# Document/image IDs: a per-process tag plus a monotonic counter is unique without
+# reading the clock on every save (timestamps can collide under bursts of auto-saves)
+_PROCESS_ID = uuid.uuid4().hex[:8]
+_id_counter = itertools.count()
+
+def _next_id(prefix: str, owner: Optional[str] = None) -> str:
+    """
+    Return a new process-unique ID such as sb_proj_1a2b3c4d_42
+    With an owner the first 8 characters are appended (sb_proj_1a2b3c4d_42_user1234)
+    """
+    if owner is None:
+        return f"{prefix}_{_PROCESS_ID}_{next(_id_counter)}"
+    return f"{prefix}_{_PROCESS_ID}_{next(_id_counter)}_{owner[:8]}"
+
+# The Firestore client is blocking; run its calls here so they don't stall the event loop
+_firestore_executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix="statblock-firestore")
+
+async def _run_firestore(func, *args, **kwargs):
+    """Run a blocking Firestore call on the Firestore executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_firestore_executor, partial(func, *args, **kwargs))
+
+# Caps concurrent Cloudflare uploads across all requests (Cloudflare Images rate limits)
+_CLOUDFLARE_UPLOAD_CONCURRENCY = 5
+_cloudflare_upload_slots = asyncio.Semaphore(_CLOUDFLARE_UPLOAD_CONCURRENCY)
+
+def _build_image_record(
+    image_id: str,
+    url: str,
+    prompt: str,
+    created_at: str,
+    original_url: Optional[str] = None
+) -> Dict[str, Any]:
+    """Build a generated-image entry as returned by /generate-image"""
+    record = {
+        "id": image_id,
+        "url": url,
+        "prompt": prompt,
+        "created_at": created_at
+    }
+    if original_url:
+        record["original_url"] = original_url
+    return record
+
+async def _upload_fal_image(
+    idx: int,
+    image_data: Dict[str, Any],
+    prompt: str,
+    image_id: str,
+    now_iso: str
+) -> Optional[Dict[str, Any]]:
+    """Copy a single Fal.ai image to Cloudflare, falling back to the Fal.ai URL"""
+    image_url = image_data.get("url")
+    if not image_url:
+        return None
+
+    try:
+        # Cloudflare fetches the Fal.ai URL itself; bytes only pass through us if that fails
+        async with _cloudflare_upload_slots:
+            cloudflare_url = await copy_image_url_to_cloudflare(image_url)
+        return _build_image_record(image_id, cloudflare_url, prompt, now_iso, original_url=image_url)
+    except Exception as upload_error:
+        logger.warning(f"Failed to upload image {idx + 1} to Cloudflare: {upload_error}")
+        # Fall back to original URL
+        return _build_image_record(image_id, image_url, prompt, now_iso)
+
+async def _upload_fal_images(
+    images: List[Dict[str, Any]],
+    prompt: str,
+    now_iso: str
+) -> List[Dict[str, Any]]:
+    """
+    Upload a Fal.ai batch concurrently
+    gather() returns results in input order, so no re-sorting or index bookkeeping is needed
+    """
+    upload_results = await asyncio.gather(*[
+        _upload_fal_image(idx, img_data, prompt, _next_id("img"), now_iso)
+        for idx, img_data in enumerate(images)
+    ])
+    return [img for img in upload_results if img is not None]
+
+# Short-lived read caches for get_project/load_session (document ID -> document dict).
+# Writes in this process invalidate their entry; other instances may serve data up to 30s stale.
+_project_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+_session_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+
+async def _get_cached_document(cache: TTLCache, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    """Return a document from the cache, fetching it from Firestore on a miss (None if missing)"""
+    data = cache.get(doc_id)
+    if data is None:
+        doc = await _run_firestore(db.collection(collection).document(doc_id).get)
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        cache[doc_id] = data
+    return data
+
+def _state_hash(state: Dict[str, Any]) -> str:
+    """Hash a project state, ignoring the per-save lastSaved stamp"""
+    content = {key: value for key, value in state.items() if key != "lastSaved"}
+    encoded = orjson.dumps(content, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+def _public_project(project_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a project document for API responses, without the internal _stateHash"""
+    return {key: value for key, value in project_data.items() if key != "_stateHash"}
+
 @router.post("/generate-statblock")
 async def generate_statblock(
     request: CreatureGenerationRequest,
@@ -112,6 +241,9 @@ async def generate_image(
     try:
         logger.info(f"Generating creature image for user: {current_user.email}, model: {request.model}, prompt: {request.sd_prompt[:50]}...")
         
+        # One timestamp per request, shared by every image in the batch
+        now_iso = datetime.now().isoformat()
+
         generated_images = []
         model_name = request.model
         
@@ -121,12 +253,8 @@ async def generate_image(
             logger.info("Using OpenAI gpt-image-1-mini for image generation")
             
             try:
-                import asyncio
-                from concurrent.futures import ThreadPoolExecutor
                 import base64
                 import io
-                from PIL import Image
-                import httpx
                 
                 # Generate all images in a single API call
                 logger.info(f"Generating {request.num_images} images in single batch...")
@@ -152,17 +280,9 @@ async def generate_image(
                     try:
                         logger.info(f"Processing OpenAI image {img_idx + 1}/{request.num_images}")
                         
-                        # Decode base64 image data
+                        # Decode base64 image data (already PNG - no need to re-encode via PIL)
                         image_bytes = base64.b64decode(image_data.b64_json)
-                        
-                        # Open image with PIL
-                        image = Image.open(io.BytesIO(image_bytes))
-                        logger.info(f"Image {img_idx + 1} size: {image.size}, mode: {image.mode}")
-                        
-                        # Save temporarily
-                        temp_filename = f"temp_openai_mini_{datetime.now().timestamp()}_{img_idx}.png"
-                        temp_path = f"/tmp/{temp_filename}"
-                        image.save(temp_path)
+                        logger.info(f"Image {img_idx + 1} size: {len(image_bytes)} bytes")
                         
                         # Upload to Cloudflare
                         cloudflare_account_id = os.environ.get('CLOUDFLARE_ACCOUNT_ID')
@@ -171,35 +291,28 @@ async def generate_image(
                         upload_url = f"https://api.cloudflare.com/client/v4/accounts/{cloudflare_account_id}/images/v1"
                         headers = {"Authorization": f"Bearer {cloudflare_api_token}"}
                         
-                        # Read file content
-                        with open(temp_path, 'rb') as f:
-                            file_content = f.read()
+                        # Hand httpx a file object so the multipart body is streamed from the
+                        # decoded buffer instead of being assembled as one contiguous copy
+                        files = {"file": ("image.png", io.BytesIO(image_bytes), "image/png")}
+                        async with _cloudflare_upload_slots:
+                            cf_response = await get_cf_http().post(upload_url, headers=headers, files=files)
+                        cf_result = cf_response.json()
                         
-                        # Upload to Cloudflare
-                        async with httpx.AsyncClient(timeout=30.0) as client:
-                            files = {"file": ("image.png", file_content, "image/png")}
-                            cf_response = await client.post(upload_url, headers=headers, files=files)
-                            cf_result = cf_response.json()
-                            
-                            if cf_result.get("success"):
-                                image_url = cf_result["result"]["variants"][0]
-                                logger.info(f"✅ Successfully uploaded OpenAI image {img_idx + 1} to Cloudflare")
-                                return {
-                                    "id": f"img_openai_mini_{datetime.now().timestamp()}_{img_idx}",
-                                    "url": image_url,
-                                    "prompt": request.sd_prompt,
-                                    "created_at": datetime.now().isoformat()
-                                }
-                            else:
-                                logger.error(f"❌ Cloudflare upload failed for image {img_idx + 1}: {cf_result}")
-                                return None
+                        if cf_result.get("success"):
+                            image_url = cf_result["result"]["variants"][0]
+                            logger.info(f"✅ Successfully uploaded OpenAI image {img_idx + 1} to Cloudflare")
+                            return _build_image_record(
+                                _next_id("img_openai_mini"),
+                                image_url,
+                                request.sd_prompt,
+                                now_iso
+                            )
+                        else:
+                            logger.error(f"❌ Cloudflare upload failed for image {img_idx + 1}: {cf_result}")
+                            return None
                     except Exception as upload_error:
                         logger.error(f"❌ Failed to process/upload OpenAI image {img_idx + 1}: {upload_error}")
                         return None
-                    finally:
-                        # Clean up temp file
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
                 
                 # Launch all uploads in PARALLEL with asyncio.gather()
                 upload_tasks = [
@@ -240,41 +353,8 @@ async def generate_image(
             if not fal_result or "images" not in fal_result:
                 raise HTTPException(status_code=400, detail="Imagen4 generation failed")
             
-            # Process Fal.ai images in PARALLEL
-            async def upload_fal_image(idx: int, image_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-                """Upload a single Fal.ai image to Cloudflare"""
-                image_url = image_data.get("url")
-                if not image_url:
-                    return None
-                
-                try:
-                    # upload_image_to_cloudflare takes 1 arg (URL) and returns URL string
-                    cloudflare_url = await upload_image_to_cloudflare(image_url)
-                    return {
-                        "id": f"img_{datetime.now().timestamp()}_{idx}",
-                        "url": cloudflare_url,
-                        "original_url": image_url,
-                        "prompt": request.sd_prompt,
-                        "created_at": datetime.now().isoformat()
-                    }
-                except Exception as upload_error:
-                    logger.warning(f"Failed to upload image {idx + 1} to Cloudflare: {upload_error}")
-                    # Fall back to original URL
-                    return {
-                        "id": f"img_{datetime.now().timestamp()}_{idx}",
-                        "url": image_url,
-                        "prompt": request.sd_prompt,
-                        "created_at": datetime.now().isoformat()
-                    }
-            
             # Upload all images in PARALLEL
-            import asyncio
-            upload_tasks = [
-                upload_fal_image(idx, img_data)
-                for idx, img_data in enumerate(fal_result["images"])
-            ]
-            upload_results = await asyncio.gather(*upload_tasks)
-            generated_images = [img for img in upload_results if img is not None]
+            generated_images = await _upload_fal_images(fal_result["images"], request.sd_prompt, now_iso)
             
             model_name = "fal-ai/imagen4/preview"
         
@@ -298,41 +378,8 @@ async def generate_image(
             if not fal_result or "images" not in fal_result:
                 raise HTTPException(status_code=400, detail="FLUX Pro generation failed")
             
-            # Process Fal.ai images in PARALLEL
-            async def upload_flux_image(idx: int, image_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-                """Upload a single FLUX Pro image to Cloudflare"""
-                image_url = image_data.get("url")
-                if not image_url:
-                    return None
-                
-                try:
-                    # upload_image_to_cloudflare takes 1 arg (URL) and returns URL string
-                    cloudflare_url = await upload_image_to_cloudflare(image_url)
-                    return {
-                        "id": f"img_{datetime.now().timestamp()}_{idx}",
-                        "url": cloudflare_url,
-                        "original_url": image_url,
-                        "prompt": request.sd_prompt,
-                        "created_at": datetime.now().isoformat()
-                    }
-                except Exception as upload_error:
-                    logger.warning(f"Failed to upload image {idx + 1} to Cloudflare: {upload_error}")
-                    # Fall back to original URL
-                    return {
-                        "id": f"img_{datetime.now().timestamp()}_{idx}",
-                        "url": image_url,
-                        "prompt": request.sd_prompt,
-                        "created_at": datetime.now().isoformat()
-                    }
-            
             # Upload all images in PARALLEL
-            import asyncio
-            upload_tasks = [
-                upload_flux_image(idx, img_data)
-                for idx, img_data in enumerate(fal_result["images"])
-            ]
-            upload_results = await asyncio.gather(*upload_tasks)
-            generated_images = [img for img in upload_results if img is not None]
+            generated_images = await _upload_fal_images(fal_result["images"], request.sd_prompt, now_iso)
             
             model_name = "fal-ai/flux-pro/new"
         
@@ -362,8 +409,9 @@ async def upload_image(
     Requires authentication for CDN storage and project association
     """
     try:
+        now = datetime.now()
         image_data = request.get("imageData")
-        filename = request.get("filename", f"statblock_upload_{datetime.now().timestamp()}")
+        filename = request.get("filename", _next_id("statblock_upload"))
         
         if not image_data:
             raise HTTPException(status_code=400, detail="Image data required")
@@ -377,10 +425,10 @@ async def upload_image(
         return {
             "success": True,
             "data": {
-                "id": f"upload_{datetime.now().timestamp()}",
+                "id": _next_id("upload"),
                 "url": cloudflare_url,
                 "prompt": "Uploaded image",
-                "created_at": datetime.now().isoformat()
+                "created_at": now.isoformat()
             }
         }
         
@@ -439,13 +487,13 @@ async def upload_images(
                 # Upload to Cloudflare
                 cloudflare_url = await upload_image_to_cloudflare(image_file)
                 
-                timestamp = datetime.now().timestamp()
+                now = datetime.now()
                 uploaded_images.append({
-                    "id": f"upload_{timestamp}_{idx}_{user_email[:8]}",
+                    "id": _next_id("upload", user_email),
                     "url": cloudflare_url,
                     "filename": image_file.filename,
                     "prompt": f"Uploaded: {image_file.filename}",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": now.isoformat()
                 })
                 
                 logger.info(f"✅ Uploaded image {idx+1}/{len(images)}: {image_file.filename}")
@@ -537,7 +585,7 @@ async def create_project(
     """
     try:
         user_id = current_user.user_id
-        project_id = f"sb_proj_{datetime.now().timestamp()}_{user_id[:8]}"
+        project_id = _next_id("sb_proj", user_id)
         
         project = StatBlockProject(
             project_id=project_id,
@@ -565,21 +613,23 @@ async def create_project(
 
 @router.get("/list-projects")
 async def list_projects(
+    summary: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     """
     List user's StatBlock projects
+    With summary=true only the list-view fields are fetched (no statblock state)
     """
     try:
         user_id = current_user.user_id
         
         projects_ref = db.collection(STATBLOCK_PROJECTS_COLLECTION)
         query = projects_ref.where("createdBy", "==", user_id)
+        if summary:
+            query = query.select(PROJECT_SUMMARY_FIELDS)
         
-        projects = []
-        for doc in query.stream():
-            project_data = doc.to_dict()
-            projects.append(project_data)
+        # Iterating the stream blocks on Firestore, so drain it on the executor
+        projects = await _run_firestore(lambda: [_public_project(doc.to_dict()) for doc in query.stream()])
         
         # Sort by updatedAt on the server side (no index required)
         projects.sort(key=lambda p: p.get("updatedAt", ""), reverse=True)
@@ -608,12 +658,14 @@ async def list_all_images(
         projects_ref = db.collection(STATBLOCK_PROJECTS_COLLECTION)
         query = projects_ref.where("createdBy", "==", user_id)
         
+        # Drain the blocking stream off the event loop, as list_projects does
+        projects = await _run_firestore(lambda: [doc.to_dict() for doc in query.stream()])
+        
         # Aggregate all images from all projects
         all_images = []
         seen_urls = set()  # Deduplicate by URL
         
-        for doc in query.stream():
-            project_data = doc.to_dict()
+        for project_data in projects:
             project_id = project_data.get("id")
             project_name = project_data.get("name", "Untitled")
             
@@ -635,7 +687,7 @@ async def list_all_images(
                     })
         
         # Sort by timestamp (most recent first)
-        all_images.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        all_images.sort(key=itemgetter("timestamp"), reverse=True)
         
         logger.info(f"Retrieved {len(all_images)} images for user: {user_id}")
         
@@ -662,21 +714,18 @@ async def get_project(
     try:
         user_id = current_user.user_id
         
-        doc_ref = db.collection(STATBLOCK_PROJECTS_COLLECTION).document(project_id)
-        doc = doc_ref.get()
+        project_data = await _get_cached_document(_project_cache, STATBLOCK_PROJECTS_COLLECTION, project_id)
         
-        if not doc.exists:
+        if project_data is None:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        project_data = doc.to_dict()
-        
         # Verify ownership
         if project_data.get("createdBy") != user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
         return {
             "success": True,
-            "data": {"project": project_data}
+            "data": {"project": _public_project(project_data)}
         }
         
     except HTTPException:
@@ -726,8 +775,10 @@ async def delete_image_from_project(
         state["generatedContent"] = generated_content
         project_data["state"] = state
         project_data["updatedAt"] = datetime.now().isoformat()
+        project_data.pop("_stateHash", None)
         
         doc_ref.set(project_data)
+        _project_cache.pop(project_id, None)
         
         logger.info(f"Removed image {image_id} from project {project_id}")
         
@@ -834,6 +885,7 @@ async def delete_project(
         
         # Delete project
         doc_ref.delete()
+        _project_cache.pop(project_id, None)
         
         logger.info(f"Deleted StatBlock project: {project_id}")
         
@@ -848,6 +900,34 @@ async def delete_project(
         logger.error(f"Error deleting project: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@firestore.transactional
+def _save_project_transaction(transaction, doc_ref, project_data: Dict[str, Any], user_id: str, now_iso: str) -> bool:
+    """
+    Create or update a project document inside a Firestore transaction
+    Returns False when the stored state already matches and nothing was written
+    """
+    snapshot = doc_ref.get(transaction=transaction)
+    
+    if snapshot.exists:
+        # Verify ownership before update
+        existing_data = snapshot.to_dict()
+        if existing_data.get("createdBy") != user_id:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        # Preserve creation time for updates
+        project_data["createdAt"] = existing_data.get("createdAt", now_iso)
+        
+        if existing_data.get("_stateHash") == project_data["_stateHash"]:
+            # Stored state is identical; keep the stored timestamps
+            project_data["updatedAt"] = existing_data.get("updatedAt", now_iso)
+            return False
+    else:
+        # New project
+        project_data["createdAt"] = now_iso
+    
+    transaction.set(doc_ref, project_data)
+    return True
+
 @router.post("/save-project")
 async def save_project(
     request: Dict[str, Any],
@@ -867,7 +947,7 @@ async def save_project(
         
         # Generate project ID if not provided (new project)
         if not project_id:
-            project_id = f"sb_proj_{datetime.now().timestamp()}_{user_id[:8]}"
+            project_id = _next_id("sb_proj", user_id)
             logger.info(f"Creating new StatBlock project: {project_id}")
         else:
             logger.info(f"Updating StatBlock project: {project_id}")
@@ -875,15 +955,15 @@ async def save_project(
         # Phase 3 Task 7: Normalize statblock (ensure all list items have IDs)
         normalized_statblock = normalize_statblock_ids(statblock)
         
-        # Prepare project data
-        now = datetime.now()
+        # Prepare project data (one timestamp for every date field in this save)
+        now_iso = datetime.now().isoformat()
         project_data = {
             "id": project_id,
             "name": normalized_statblock.get("name", "Untitled Creature"),
             "description": normalized_statblock.get("description", ""),
             "createdBy": user_id,
-            "updatedAt": now.isoformat(),
-            "lastModified": now.isoformat(),
+            "updatedAt": now_iso,
+            "lastModified": now_iso,
             "state": {
                 "creatureDetails": normalized_statblock,
                 "currentStepId": request.get("currentStepId", "creature-description"),
@@ -891,7 +971,7 @@ async def save_project(
                 "selectedAssets": request.get("selectedAssets", {}),
                 "generatedContent": request.get("generatedContent", {}),
                 "autoSaveEnabled": True,
-                "lastSaved": now.isoformat()
+                "lastSaved": now_iso
             },
             "metadata": {
                 "version": "1.0.0",
@@ -901,26 +981,20 @@ async def save_project(
             }
         }
         
-        # Check if project exists (for update vs create)
+        project_data["_stateHash"] = _state_hash(project_data["state"])
+        
+        # Ownership check, createdAt carry-over, the unchanged-state check against the stored
+        # _stateHash and the write all happen in one transaction
         doc_ref = db.collection(STATBLOCK_PROJECTS_COLLECTION).document(project_id)
-        doc = doc_ref.get()
+        written = await _run_firestore(
+            _save_project_transaction, db.transaction(), doc_ref, project_data, user_id, now_iso
+        )
         
-        if doc.exists:
-            # Verify ownership before update
-            existing_data = doc.to_dict()
-            if existing_data.get("createdBy") != user_id:
-                raise HTTPException(status_code=403, detail="Access denied")
-            
-            # Preserve creation time for updates
-            project_data["createdAt"] = existing_data.get("createdAt", now.isoformat())
+        if written:
+            _project_cache.pop(project_id, None)
+            logger.info(f"Saved StatBlock project: {project_id} for user: {user_id}")
         else:
-            # New project
-            project_data["createdAt"] = now.isoformat()
-        
-        # Save to Firestore
-        doc_ref.set(project_data)
-        
-        logger.info(f"Saved StatBlock project: {project_id} for user: {user_id}")
+            logger.info(f"StatBlock project unchanged, skipping save: {project_id}")
         
         return {
             "success": True,
@@ -936,91 +1010,61 @@ async def save_project(
         logger.error(f"Error saving project: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def normalize_statblock_ids(statblock: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Phase 3 Task 7: Ensure all list items have stable IDs
-    Backend ID generation with frontend fallback support
-    """
-    import uuid
-    
-    def ensure_id(item: Dict[str, Any]) -> Dict[str, Any]:
-        """Ensure an item has an ID"""
-        if not item.get("id"):
-            item["id"] = str(uuid.uuid4())
-        return item
-    
-    # Normalize actions
-    if "actions" in statblock and isinstance(statblock["actions"], list):
-        statblock["actions"] = [ensure_id(action) for action in statblock["actions"]]
-    
-    # Normalize bonus actions
-    if "bonusActions" in statblock and isinstance(statblock["bonusActions"], list):
-        statblock["bonusActions"] = [ensure_id(action) for action in statblock["bonusActions"]]
-    
-    # Normalize reactions
-    if "reactions" in statblock and isinstance(statblock["reactions"], list):
-        statblock["reactions"] = [ensure_id(reaction) for reaction in statblock["reactions"]]
-    
-    # Normalize special abilities
-    if "specialAbilities" in statblock and isinstance(statblock["specialAbilities"], list):
-        statblock["specialAbilities"] = [ensure_id(ability) for ability in statblock["specialAbilities"]]
-    
-    # Normalize spells
-    if "spells" in statblock and isinstance(statblock["spells"], dict):
-        if "cantrips" in statblock["spells"] and isinstance(statblock["spells"]["cantrips"], list):
-            statblock["spells"]["cantrips"] = [ensure_id(spell) for spell in statblock["spells"]["cantrips"]]
-        if "knownSpells" in statblock["spells"] and isinstance(statblock["spells"]["knownSpells"], list):
-            statblock["spells"]["knownSpells"] = [ensure_id(spell) for spell in statblock["spells"]["knownSpells"]]
-    
-    # Normalize legendary actions
-    if "legendaryActions" in statblock and isinstance(statblock["legendaryActions"], dict):
-        if "actions" in statblock["legendaryActions"] and isinstance(statblock["legendaryActions"]["actions"], list):
-            statblock["legendaryActions"]["actions"] = [ensure_id(action) for action in statblock["legendaryActions"]["actions"]]
-    
-    # Normalize lair actions
-    if "lairActions" in statblock and isinstance(statblock["lairActions"], dict):
-        if "actions" in statblock["lairActions"] and isinstance(statblock["lairActions"]["actions"], list):
-            statblock["lairActions"]["actions"] = [ensure_id(action) for action in statblock["lairActions"]["actions"]]
-    
-    return statblock
-
 # Session Management Endpoints
 
 @router.post("/save-session")
 async def save_session(
-    request: SessionSaveRequest,
+    http_request: Request,
     current_user: Optional[User] = Depends(get_current_user)
 ):
     """
     Save StatBlock generator session state
+    Body: SessionSaveRequest (validated straight from the raw JSON bytes)
     """
+    # Auto-save sends the whole statblock tree; validating from bytes skips building
+    # an intermediate dict with json.loads before Pydantic walks it
+    try:
+        request = SessionSaveRequest.model_validate_json(await http_request.body())
+    except ValidationError as ve:
+        # Same 422 shape FastAPI produces for a declared body parameter
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in ve.errors(include_url=False)]
+        )
+    
     try:
         session_data = request.session_data
         
         # Update timestamps
-        session_data.last_modified = datetime.now()
+        now = datetime.now()
+        session_data.last_modified = now
         if not session_data.created_at:
-            session_data.created_at = datetime.now()
+            session_data.created_at = now
         
         # Set user ID if authenticated
         if current_user:
             session_data.user_id = current_user.user_id
         
-        # Save to Firestore
+        # Save to Firestore - session and (optional) creature go out in a single commit
+        batch = db.batch()
         doc_ref = db.collection(STATBLOCK_SESSIONS_COLLECTION).document(session_data.session_id)
-        doc_ref.set(session_data.dict())
+        session_dict = session_data.model_dump()
+        batch.set(doc_ref, session_dict)
         
         # If this is a manual save with creature name, also save creature separately
         if not request.is_auto_save and request.creature_name and session_data.creature_details:
-            creature_id = f"sb_creature_{datetime.now().timestamp()}"
-            creature_data = session_data.creature_details.dict()
+            creature_id = _next_id("sb_creature")
+            # Reuse the subtree already dumped for the session instead of serializing it again
+            creature_data = dict(session_dict["creature_details"])
             creature_data["id"] = creature_id
             creature_data["name"] = request.creature_name
             creature_data["project_id"] = session_data.project_id
             creature_data["user_id"] = session_data.user_id
             
             creature_ref = db.collection(STATBLOCK_CREATURES_COLLECTION).document(creature_id)
-            creature_ref.set(creature_data)
+            batch.set(creature_ref, creature_data)
+        
+        await _run_firestore(batch.commit)
+        _session_cache.pop(session_data.session_id, None)
         
         logger.info(f"Saved StatBlock session: {session_data.session_id}")
         
@@ -1046,21 +1090,19 @@ async def load_session(
     Load StatBlock generator session state
     """
     try:
-        doc_ref = db.collection(STATBLOCK_SESSIONS_COLLECTION).document(session_id)
-        doc = doc_ref.get()
+        session_data = await _get_cached_document(_session_cache, STATBLOCK_SESSIONS_COLLECTION, session_id)
         
-        if not doc.exists:
+        if session_data is None:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        session_data = doc.to_dict()
-        
         # Verify access (owner or anonymous)
         if current_user and session_data.get("user_id") != current_user.user_id:
             raise HTTPException(status_code=403, detail="Access denied")
         
+        # Shallow copy so callers can't mutate the cached document
         return {
             "success": True,
-            "data": {"session": session_data}
+            "data": {"session": dict(session_data)}
         }
         
     except HTTPException:
@@ -1,12 +1,157 @@
-import pandas as pd
 import numpy as np
-from openai import OpenAI
-from sentence_transformers import util, SentenceTransformer
-import torch
-import time
-from datetime import datetime
 import textwrap
 import json
+import orjson
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+
+try:
+    import faiss  # Optional: pip install faiss-cpu (extra "faiss")
+except ImportError:
+    faiss = None
+
+# Corpora at least this large get an approximate HNSW index; smaller ones are searched exactly
+HNSW_MIN_VECTORS = 10000
+
+EMBEDDING_MODEL_NAME = 'BAAI/bge-m3'
+# "torch" (default) or "onnx" - ONNX Runtime is faster on CPU; needs the "onnx" extra installed
+EMBEDDING_BACKEND = os.getenv('RULESLAWYER_EMBEDDING_BACKEND', 'torch')
+
+# The embedding model is stateless at inference time, so one instance serves every loader
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+def get_embedding_model():
+    """Return the shared SentenceTransformer, loading it on first use."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                # Imported here: sentence_transformers pulls in torch, which is slow and heavy to load
+                from sentence_transformers import SentenceTransformer
+                _embedding_model = SentenceTransformer(
+                    model_name_or_path=EMBEDDING_MODEL_NAME,
+                    device='cpu',
+                    backend=EMBEDDING_BACKEND
+                )
+    return _embedding_model
+
+def parse_embedding_column(values):
+    """Parse JSON-encoded vectors into a single (n, dim) float32 matrix."""
+    if len(values) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    first = orjson.loads(values[0])
+    embeddings = np.empty((len(values), len(first)), dtype=np.float32)
+    embeddings[0] = first
+    for row, value in enumerate(values[1:], start=1):
+        embeddings[row] = orjson.loads(value)
+    return embeddings
+
+def normalize_rows(embeddings):
+    """L2-normalize each row in place and return the array."""
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings
+
+# LRU of query text -> embedding, filled by encode_query and by QueryEmbeddingBatcher batches
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+_query_embedding_cache = OrderedDict()
+_query_embedding_cache_lock = threading.Lock()
+
+def get_cached_query_embedding(query: str):
+    """Return the cached embedding of a query, or None if it hasn't been embedded recently."""
+    with _query_embedding_cache_lock:
+        embedding = _query_embedding_cache.get(query)
+        if embedding is not None:
+            _query_embedding_cache.move_to_end(query)
+        return embedding
+
+def cache_query_embedding(query: str, embedding):
+    """Store a query embedding (made read-only) in the LRU and return it."""
+    embedding.setflags(write=False)
+    with _query_embedding_cache_lock:
+        _query_embedding_cache[query] = embedding
+        _query_embedding_cache.move_to_end(query)
+        while len(_query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embedding_cache.popitem(last=False)
+    return embedding
+
+def encode_query(query: str):
+    """
+    Embed a query with the shared model as a unit-length float32 vector.
+    Cached, so retries and repeated questions skip the transformer; the result is read-only.
+    """
+    embedding = get_cached_query_embedding(query)
+    if embedding is None:
+        embedding = cache_query_embedding(query, get_embedding_model().encode(
+            query, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False))
+    return embedding
+
+def encode_queries(queries: list[str]):
+    """Embed several queries in one model call; returns a (len(queries), dim) float32 matrix."""
+    return get_embedding_model().encode(
+        queries, batch_size=len(queries), convert_to_numpy=True, normalize_embeddings=True
+    ).astype(np.float32, copy=False)
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces query embeddings from concurrent requests into one encode() call.
+
+    Callers await embed(); queued queries are flushed after max_wait seconds or as soon as
+    max_batch_size are waiting, and encoded together on a worker thread. Queries already in
+    the encode_query cache are answered from it, and batch results are added to it.
+    """
+
+    def __init__(self, max_wait: float = 0.01, max_batch_size: int = 32):
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def embed(self, query: str):
+        """Return the unit-length float32 embedding of a query."""
+        query = " ".join(query.split())
+        embedding = get_cached_query_embedding(query)
+        if embedding is not None:
+            return embedding
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._encode_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _encode_batch(self, batch):
+        queries = [query for query, _ in batch]
+        try:
+            embeddings = await asyncio.to_thread(encode_queries, queries)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (query, future), embedding in zip(batch, embeddings):
+            embedding = cache_query_embedding(query, embedding)
+            if not future.done():
+                future.set_result(embedding)
 
 class EmbeddingLoader:
     def __init__(self, embeddings_file_path=None, enhanced_json_path=None, cached_data=None):
@@ -18,15 +163,14 @@ class EmbeddingLoader:
             enhanced_json_path (str, optional): Path to the enhanced JSON file.
             cached_data (dict, optional): Preloaded embeddings and pages/chunks.
         """
-        self.embedding_model = SentenceTransformer(
-            model_name_or_path='BAAI/bge-m3',
-            device='cpu'
-        )
+        self.embedding_model = get_embedding_model()
         self.document_summary = None
         self.page_summaries = None
 
         if cached_data:
-            self.pages_and_chunks, self.embeddings = cached_data
+            self.pages_and_chunks, embeddings = cached_data
+            # Convert once here so queries never re-convert or upcast the corpus matrix
+            self.embeddings = normalize_rows(np.array(embeddings, dtype=np.float32, copy=True))
         else:
             self.embeddings_file_path = embeddings_file_path
             self.enhanced_json_path = enhanced_json_path
@@ -34,33 +178,119 @@ class EmbeddingLoader:
             if enhanced_json_path:
                 self.document_summary, self.page_summaries = self._load_enhanced_json()
 
+        self.index = self._build_index(self.embeddings)
+
     def _load_embeddings(self):
-        """Load and process the embeddings CSV file."""
+        """Load the embeddings, preferring the binary cache written next to the CSV."""
         print(f"Loading embeddings from: {self.embeddings_file_path}")
         try:
+            cached = self._load_embeddings_cache()
+            if cached is not None:
+                return cached
+
+            import pandas as pd
+
             # Load the CSV file
             df = pd.read_csv(self.embeddings_file_path)
             print("Embedding file loaded")
 
-            # Convert stringified embeddings to numpy arrays
-            df['embedding'] = df['embedding'].apply(lambda x: np.array(json.loads(x), dtype=np.float64))
+            # Parse the stringified embeddings straight into one preallocated matrix
+            embeddings = parse_embedding_column(df['embedding'].to_numpy())
             
-            # Combine all embeddings into a single numpy array
-            embeddings = np.vstack(df['embedding'].to_numpy())
+            # Unit-length rows: a plain dot product is then the cosine similarity
+            embeddings = normalize_rows(embeddings)
             
-            # Convert to list of dicts for pages and chunks
-            pages_and_chunks = df.to_dict(orient="records")
+            # Chunk metadata only; the vectors live in `embeddings`
+            metadata = df.drop(columns=['embedding'])
+            self._write_embeddings_cache(metadata, embeddings)
             
-            # Debug info
-            # print("DataFrame columns:", df.columns)
-            # print("\nFirst few rows of the DataFrame:")
-            # print(df.head())
+            # Convert to list of dicts for pages and chunks
+            pages_and_chunks = metadata.to_dict(orient="records")
             
             return pages_and_chunks, embeddings  # `embeddings` is now a single numpy array
             
         except Exception as e:
             raise Exception(f"Failed to load embeddings: {str(e)}")
 
+    @classmethod
+    def build_embeddings(cls, chunks: list[dict], embeddings_file_path: str, enhanced_json_path=None, batch_size: int = 64):
+        """
+        Embed corpus chunks (dicts with a 'content' key) and write the CSV this loader reads.
+
+        Chunks are encoded in batches of batch_size; sentence-transformers orders each call by
+        text length, so batches hold similar-length chunks and little padding. Rows keep the
+        input order. Returns a loader for the new corpus (which also writes the .npy cache).
+        """
+        import pandas as pd
+
+        embeddings = get_embedding_model().encode(
+            [chunk['content'] for chunk in chunks],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=True
+        ).astype(np.float32, copy=False)
+
+        df = pd.DataFrame(chunks)
+        df['embedding'] = [orjson.dumps(row.tolist()).decode() for row in embeddings]
+        df.to_csv(embeddings_file_path, index=False)
+        print(f"Wrote {len(df)} embeddings to: {embeddings_file_path}")
+
+        return cls(embeddings_file_path=embeddings_file_path, enhanced_json_path=enhanced_json_path)
+
+    def _embeddings_cache_paths(self):
+        """Paths of the .npy vectors and pickled chunk metadata cached beside the CSV."""
+        return f"{self.embeddings_file_path}.npy", f"{self.embeddings_file_path}.meta.pkl"
+
+    def _load_embeddings_cache(self):
+        """Memory-map the cached vectors if the cache exists and is newer than the CSV."""
+        npy_path, meta_path = self._embeddings_cache_paths()
+        try:
+            csv_mtime = os.path.getmtime(self.embeddings_file_path)
+            if min(os.path.getmtime(npy_path), os.path.getmtime(meta_path)) < csv_mtime:
+                return None
+        except OSError:
+            return None
+
+        import pandas as pd
+
+        # Read-only mmap: pages are shared through the OS page cache by every loader of this corpus
+        embeddings = np.load(npy_path, mmap_mode='r')
+        pages_and_chunks = pd.read_pickle(meta_path).to_dict(orient="records")
+        print(f"Embedding cache loaded: {npy_path}")
+        return pages_and_chunks, embeddings
+
+    def _write_embeddings_cache(self, metadata, embeddings):
+        """Persist parsed embeddings so later loads skip CSV/JSON parsing (best effort)."""
+        npy_path, meta_path = self._embeddings_cache_paths()
+        try:
+            # Write to temp files and rename so a concurrent loader never sees a partial cache
+            with open(f"{npy_path}.tmp", 'wb') as file:
+                np.save(file, np.ascontiguousarray(embeddings, dtype=np.float32))
+            metadata.to_pickle(f"{meta_path}.tmp")
+            os.replace(f"{meta_path}.tmp", meta_path)
+            os.replace(f"{npy_path}.tmp", npy_path)
+        except OSError as e:
+            print(f"Warning: Could not write embedding cache: {str(e)}")
+
+    def _build_index(self, embeddings):
+        """Build a FAISS inner-product index over the embeddings (None if FAISS is unavailable)."""
+        if faiss is None:
+            return None
+
+        # Copy: normalize_L2 works in place and the embeddings may be a read-only mmap
+        vectors = np.array(embeddings, dtype=np.float32, copy=True)
+        faiss.normalize_L2(vectors)
+        dim = vectors.shape[1]
+
+        if len(vectors) >= HNSW_MIN_VECTORS:
+            index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+        else:
+            index = faiss.IndexFlatIP(dim)
+        index.add(vectors)
+        print(f"Built {type(index).__name__} over {index.ntotal} embeddings")
+        return index
 
     def _load_enhanced_json(self):
         """Load and process the enhanced JSON file if provided."""
@@ -77,32 +307,39 @@ class EmbeddingLoader:
             print(f"Warning: Failed to load enhanced JSON: {str(e)}")
             return None, None
 
-    def retrieve_relevant_resources(self, query: str, n_resources_to_return: int = 4):
-        """Embeds a query and returns top k scores and indices from embeddings."""
+    def retrieve_relevant_resources(self, query: str, n_resources_to_return: int = 4, query_embedding=None):
+        """
+        Embeds a query and returns top k scores and indices from embeddings.
+        Pass query_embedding (e.g. from QueryEmbeddingBatcher) to skip embedding the query here.
+        """
         print(f"Retrieving relevant resources for query: {query}")
-        query_embedding = self.embedding_model.encode(query, convert_to_tensor=False)
-        
-        # Convert query embedding directly to a numpy array before tensor creation
-        query_tensor = torch.tensor(np.array([query_embedding], dtype=np.float64), dtype=torch.float64).to('cpu')
-        # print(f"Query tensor: {query_tensor}")
-
-        # Convert embeddings to tensor
-        embeddings_tensor = torch.tensor(self.embeddings, dtype=torch.float64).to('cpu')
-        # print(f"Embeddings tensor: {embeddings_tensor}")
-        # Calculate dot scores
-        dot_scores = util.dot_score(query_tensor, embeddings_tensor)[0]
-        print(f"Dot scores: {dot_scores}")
-        # Return top scores and indices
-        return torch.topk(input=dot_scores, k=n_resources_to_return)
+        if query_embedding is None:
+            query_embedding = self._encode_query(query)
+        k = min(n_resources_to_return, len(self.pages_and_chunks))
 
+        if self.index is not None:
+            scores, indices = self.index.search(query_embedding.reshape(1, -1), k)
+            return scores[0], indices[0]
 
+        # Single BLAS matvec over the normalized corpus
+        dot_scores = self.embeddings @ query_embedding
+        print(f"Dot scores: {dot_scores}")
+        # Partial selection of the top k, then order just those k (highest first)
+        top_indices = np.argpartition(-dot_scores, k - 1)[:k]
+        top_indices = top_indices[np.argsort(-dot_scores[top_indices])]
+        return dot_scores[top_indices], top_indices
+
+    def _encode_query(self, query: str):
+        """Embed a query as a unit-length float32 vector (cached per normalized query text)."""
+        return encode_query(" ".join(query.split()))
 
-    def print_top_results_and_scores(self, query: str, n_resources_to_return: int = 5):
+    def print_top_results_and_scores(self, query: str, n_resources_to_return: int = 5, query_embedding=None):
         """Retrieves and prints most relevant resources."""
         print(f"Printing top results and scores for query: {query}")
         scores, indices = self.retrieve_relevant_resources(
             query=query,
-            n_resources_to_return=n_resources_to_return
+            n_resources_to_return=n_resources_to_return,
+            query_embedding=query_embedding
         )
         
         for i, (score, index) in enumerate(zip(scores, indices)):
@@ -115,15 +352,17 @@ class EmbeddingLoader:
 
     def format_prompt(self, query: str, context_items: list[dict]) -> str:
         """Formats the prompt with context and query."""
-        formatted_context = f"Document Summary: {self.document_summary}\n\n" if self.document_summary else ""
+        parts = [f"Document Summary: {self.document_summary}\n\n"] if self.document_summary else []
+        page_summaries = self.page_summaries or {}
         
         for item in context_items:
             page_number = item.get('page', 'Unknown')
-            page_summary = self.page_summaries.get(page_number, '') if self.page_summaries else ''
+            page_summary = page_summaries.get(page_number, '')
             if page_summary:
                 print(f"Page {page_number}: {page_summary}")
-                formatted_context += f"Page {page_number}: {page_summary}\n\n"
-            formatted_context += f"Content from page {page_number}: {item.get('content', '')}\n\n"
+                parts.append(f"Page {page_number}: {page_summary}\n\n")
+            parts.append(f"Content from page {page_number}: {item.get('content', '')}\n\n")
+        formatted_context = "".join(parts)
 
         return f"""Use the following context to answer the user query:
 
@@ -132,26 +371,68 @@ class EmbeddingLoader:
 User query: {query}
 Answer:"""
 
-def generate_bot_response(message, chat_history, embeddings_loader, client, system_prompt):
-    """Generate a response using the embedding loader and OpenAI."""
-    # print(f"Generating bot response for message: {message}")
-    scores, indices = embeddings_loader.print_top_results_and_scores(query=message)
+# Corpora are read-only once loaded, so every session/request shares one loader per file pair
+_LOADER_CACHE: dict[tuple[str, str | None], EmbeddingLoader] = {}
+_loader_cache_lock = threading.Lock()
+
+def get_embedding_loader(embeddings_file_path: str, enhanced_json_path: str = None) -> EmbeddingLoader:
+    """Return the shared EmbeddingLoader for these files, loading it on first use."""
+    key = (os.path.abspath(embeddings_file_path), os.path.abspath(enhanced_json_path) if enhanced_json_path else None)
+    loader = _LOADER_CACHE.get(key)
+    if loader is None:
+        with _loader_cache_lock:
+            loader = _LOADER_CACHE.get(key)
+            if loader is None:
+                loader = EmbeddingLoader(embeddings_file_path=embeddings_file_path, enhanced_json_path=enhanced_json_path)
+                _LOADER_CACHE[key] = loader
+    return loader
+
+# Completion settings shared by the buffered and streaming responses
+CHAT_MODEL = "gpt-4"
+CHAT_COMPLETION_KWARGS = {
+    "temperature": 1,
+    "max_tokens": 512,
+    "top_p": 1,
+    "frequency_penalty": 0,
+    "presence_penalty": 0
+}
+
+async def _build_chat_messages(message, embeddings_loader, system_prompt, query_embedding=None):
+    """Retrieve context for a message and build the chat messages for OpenAI."""
+    # Retrieval may still need to embed the query, so keep it off the event loop
+    scores, indices = await asyncio.to_thread(
+        embeddings_loader.print_top_results_and_scores, query=message, query_embedding=query_embedding
+    )
     context_items = [embeddings_loader.pages_and_chunks[i] for i in indices]
     prompt = embeddings_loader.format_prompt(query=message, context_items=context_items)
+    return [{"role": "user", "content": f"{system_prompt} {prompt}"}]
+
+async def generate_bot_response(message, chat_history, embeddings_loader, client, system_prompt, query_embedding=None):
+    """Generate a response using the embedding loader and OpenAI (client is an AsyncOpenAI)."""
+    # print(f"Generating bot response for message: {message}")
+    messages = await _build_chat_messages(message, embeddings_loader, system_prompt, query_embedding)
     
-    bot_message = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": f"{system_prompt} {prompt}"}],
-        temperature=1,
-        max_tokens=512,
-        top_p=1,
-        frequency_penalty=0,
-        presence_penalty=0
+    bot_message = await client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        **CHAT_COMPLETION_KWARGS
     )
     
     response = bot_message.choices[0].message.content
     # print(f"Bot message: {response}")
     chat_history.append((message, response))
-    time.sleep(2)
     return response, chat_history
 
+async def stream_bot_response(message, embeddings_loader, client, system_prompt, query_embedding=None):
+    """Yield the response text as OpenAI streams it (client is an AsyncOpenAI)."""
+    messages = await _build_chat_messages(message, embeddings_loader, system_prompt, query_embedding)
+    
+    stream = await client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        stream=True,
+        **CHAT_COMPLETION_KWARGS
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
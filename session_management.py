@@ -1,6 +1,8 @@
 from typing import Dict, Optional, Any, List
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import uuid
+import heapq
 import logging
 from fastapi import Depends, HTTPException, Request
 from models.session_models import (
@@ -11,12 +13,28 @@ from models.session_models import (
 from models.dungeonmind_objects import StepId
 
 logger = logging.getLogger(__name__)
+
+# Stale expiry heap entries tolerated beyond 2x the live sessions before the heap is rebuilt
+EXPIRY_HEAP_SLACK = 64
+
 class EnhancedGlobalSessionManager:
     """Enhanced session manager with CardGenerator support and cross-tool features"""
     
-    def __init__(self, session_timeout_hours: int = 24):
-        self.sessions: Dict[str, EnhancedGlobalSession] = {}
+    def __init__(self, session_timeout_hours: int = 24, max_sessions: int = 10000):
+        # Ordered least- to most-recently used; the oldest are evicted beyond max_sessions
+        self.sessions: "OrderedDict[str, EnhancedGlobalSession]" = OrderedDict()
         self.session_timeout = timedelta(hours=session_timeout_hours)
+        self.max_sessions = max_sessions
+        # Min-heap of (expires_at, session_id) so cleanup only visits sessions that are due.
+        # Entries go stale when a session is deleted or extended; cleanup skips or re-queues them,
+        # and the heap is rebuilt from live sessions once stale entries outnumber live ones.
+        self._expiry_heap: List[tuple[datetime, str]] = []
+
+    def _compact_expiry_heap(self):
+        """Rebuild the expiry heap from live sessions if removals have left it mostly stale"""
+        if len(self._expiry_heap) > 2 * len(self.sessions) + EXPIRY_HEAP_SLACK:
+            self._expiry_heap = [(session.expires_at, session_id) for session_id, session in self.sessions.items()]
+            heapq.heapify(self._expiry_heap)
 
     def create_session(
         self, 
@@ -43,7 +61,14 @@ class EnhancedGlobalSessionManager:
         )
         
         self.sessions[session_id] = session
+        heapq.heappush(self._expiry_heap, (session.expires_at, session_id))
         logger.info(f"Created new enhanced session: {session_id} for user: {user_id}")
+        
+        # Cap memory: drop the least recently used sessions (their heap entries are skipped or compacted away)
+        while len(self.sessions) > self.max_sessions:
+            evicted_id, _ = self.sessions.popitem(last=False)
+            logger.info(f"Evicted least recently used session: {evicted_id}")
+        self._compact_expiry_heap()
         return session_id
 
     def get_session(self, session_id: str) -> Optional[EnhancedGlobalSession]:
@@ -55,9 +80,11 @@ class EnhancedGlobalSessionManager:
             if session.is_expired():
                 logger.info(f"Session {session_id} has expired, removing")
                 del self.sessions[session_id]
+                self._compact_expiry_heap()
                 return None
             
             session.update_access_time()
+            self.sessions.move_to_end(session_id)
             return session
         return None
 
@@ -65,6 +92,7 @@ class EnhancedGlobalSessionManager:
         """Delete a specific session"""
         if session_id in self.sessions:
             del self.sessions[session_id]
+            self._compact_expiry_heap()
             logger.info(f"Deleted session: {session_id}")
             return True
         return False
@@ -135,20 +163,27 @@ class EnhancedGlobalSessionManager:
         return True
 
     def cleanup_old_sessions(self):
-        """Remove expired sessions"""
+        """Remove expired sessions (visits only heap entries that are due, not every session)"""
         current_time = datetime.now()
-        expired_sessions = []
+        expired_count = 0
         
-        for session_id, session in self.sessions.items():
-            if session.is_expired():
-                expired_sessions.append(session_id)
-                
-        for session_id in expired_sessions:
+        while self._expiry_heap and self._expiry_heap[0][0] < current_time:
+            expires_at, session_id = heapq.heappop(self._expiry_heap)
+            session = self.sessions.get(session_id)
+            if session is None:
+                # Already deleted
+                continue
+            if session.expires_at != expires_at:
+                # Expiration was extended; re-queue under the new time
+                heapq.heappush(self._expiry_heap, (session.expires_at, session_id))
+                continue
+            
             logger.info(f"Cleaning up expired session: {session_id}")
             del self.sessions[session_id]
+            expired_count += 1
             
-        if expired_sessions:
-            logger.info(f"Cleaned up {len(expired_sessions)} expired sessions")
+        if expired_count:
+            logger.info(f"Cleaned up {expired_count} expired sessions")
 
     def get_session_status(self, session: EnhancedGlobalSession) -> SessionStatus:
         """Get comprehensive status of a session"""
@@ -1,18 +1,35 @@
-from fastapi import APIRouter, Request, Response, HTTPException
+from fastapi import APIRouter, Request, Response, HTTPException, Query
 from twilio.twiml.messaging_response import MessagingResponse
-from twilio.request_validator import RequestValidator
+from twilio.request_validator import RequestValidator, add_port, remove_port
 import httpx
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx; installed by the httpx[http2] extra)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+import base64
+import hashlib
+import hmac
 import logging
 import os
-from typing import Optional
-import json
-from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional
+import orjson
+from datetime import datetime, timezone
+from urllib.parse import urlparse
 import asyncio
-from functools import lru_cache
+import heapq
+import itertools
+import random
+import time
+from cachetools import TTLCache
 
 router = APIRouter()
+# Endpoints that spend the server's Twilio credentials; app.py mounts this behind user auth
+media_router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Everything here is I/O-bound; uvicorn runs it on uvloop (a pyproject dependency) when that is installed
+
 # Configuration Management
 class SMSConfig:
     """Centralized configuration management for SMS router"""
@@ -26,6 +43,8 @@ class SMSConfig:
         self.twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
         self.twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
         self.test_mode = os.getenv("TWILIO_TEST_MODE", "false").lower() == "true"
+        # Validate signatures with the twilio SDK's RequestValidator instead of the inline HMAC
+        self.use_sdk_validator = os.getenv("TWILIO_SDK_SIGNATURE_VALIDATION", "false").lower() == "true"
         
         # Webhook Configuration
         self.webhook_url = os.getenv("TWILIO_WEBHOOK_URL", "https://www.dungeonmind.net/api/sms/receive")
@@ -37,6 +56,10 @@ class SMSConfig:
         # Timeout Configuration
         self.request_timeout = int(os.getenv("SMS_REQUEST_TIMEOUT", "10"))
         
+        # Concurrency Configuration
+        self.max_inflight = int(os.getenv("SMS_MAX_INFLIGHT", "32"))
+        self.max_media_downloads = int(os.getenv("SMS_MAX_MEDIA_DOWNLOADS", "10"))
+        
         # Validation
         self._validate_config()
     
@@ -67,6 +90,8 @@ class SMSConfig:
         logger.info(f"Test Mode: {self.test_mode}")
         logger.info(f"Max Retries: {self.max_retries}")
         logger.info(f"Request Timeout: {self.request_timeout}s")
+        logger.info(f"Max In-flight Forwards: {self.max_inflight}")
+        logger.info(f"Max Concurrent Media Downloads: {self.max_media_downloads}")
         logger.info(f"External API Key: {'*' * len(self.external_api_key) if self.external_api_key else 'None'}")
         logger.info(f"Twilio Account SID: {'*' * len(self.twilio_account_sid) if self.twilio_account_sid else 'None'}")
         logger.info(f"Twilio Auth Token: {'*' * len(self.twilio_auth_token) if self.twilio_auth_token else 'None'}")
@@ -79,137 +104,382 @@ except ValueError as e:
     logger.error(f"Configuration error: {e}")
     raise
 
-# In-memory cache for failed messages
-failed_messages = {}
+# Failed messages wait for the background retry worker in a min-heap of (retry_at, sequence, message),
+# so the worker only touches messages that are due; bounded so an outage can't exhaust memory
+retry_heap: List[tuple] = []
+retry_heap_limit = int(os.getenv("SMS_RETRY_QUEUE_SIZE", "1000"))
+retry_wakeup = asyncio.Event()
+retry_sequence = itertools.count()
+retry_stats = {"retried": 0, "dropped": 0}
+retry_worker_task: Optional[asyncio.Task] = None
+# Strong references to in-flight forwards; the event loop only keeps weak ones
+forward_tasks: set = set()
+FAILED_MESSAGE_TTL = 24 * 3600  # seconds
+FAILED_RETRY_BASE_DELAY = 30  # seconds; doubled after every failed retry
+FAILED_RETRY_MAX_DELAY = 3600
+RETRY_BATCH_SIZE = 8  # due messages retried concurrently per pass, leaving FORWARD_SEM slots for live webhooks
+FORWARD_RETRY_MAX_DELAY = 30.0  # seconds; cap on the in-request backoff inside forward_message
+
+# Outbound headers are the same for every forward
+FORWARD_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {config.external_api_key}"
+}
+
+# Caps concurrent forwards so webhook bursts can't flood the external API
+FORWARD_SEM = asyncio.Semaphore(config.max_inflight)
+# Caps concurrent media downloads so fanning out over an MMS stays within Twilio's rate limits
+MEDIA_SEM = asyncio.Semaphore(config.max_media_downloads)
+
+# Twilio sends at most 10 attachments per MMS as MediaUrl{i}/MediaContentType{i} form fields
+MAX_MEDIA_PER_MESSAGE = 10
+MEDIA_FIELD_KEYS = tuple((f"MediaUrl{i}", f"MediaContentType{i}") for i in range(MAX_MEDIA_PER_MESSAGE))
+
+# Every reply is the same empty TwiML document, so render it once
+EMPTY_TWIML = str(MessagingResponse()).encode("utf-8")
 
 # Supported media types for MMS
-SUPPORTED_MEDIA_TYPES = {
+SUPPORTED_MEDIA_TYPES = frozenset({
     'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp',
     'video/mp4', 'video/quicktime', 'video/mpeg', 'video/webm',
     'audio/mpeg', 'audio/mp3', 'audio/wav', 'audio/ogg', 'audio/webm',
     'application/pdf', 'text/plain', 'text/vcard'
-}
+})
+SUPPORTED_MEDIA_TYPES_SORTED = tuple(sorted(SUPPORTED_MEDIA_TYPES))
+# Twilio serves MMS media from its REST API host; nothing else is fetched with our credentials
+TWILIO_MEDIA_HOSTS = frozenset({"api.twilio.com"})
+
+# Webhook timestamps only need whole seconds, so the ISO string is formatted once per second
+_iso_timestamp_cache = (0, "")
+
+def utc_timestamp() -> str:
+    """Current UTC time as a naive ISO 8601 string, to the second"""
+    global _iso_timestamp_cache
+    now = int(time.time())
+    if _iso_timestamp_cache[0] != now:
+        _iso_timestamp_cache = (now, datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None).isoformat())
+    return _iso_timestamp_cache[1]
+
+# Shared HTTP clients keep connections to the external API and api.twilio.com warm across webhooks
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0)
+EXTERNAL_HTTP: Optional[httpx.AsyncClient] = None
+TWILIO_HTTP: Optional[httpx.AsyncClient] = None
+
+def get_external_http() -> httpx.AsyncClient:
+    """Return the shared client for the external message API, creating it on first use"""
+    global EXTERNAL_HTTP
+    if EXTERNAL_HTTP is None or EXTERNAL_HTTP.is_closed:
+        EXTERNAL_HTTP = httpx.AsyncClient(
+            timeout=httpx.Timeout(config.request_timeout, connect=3.0, pool=5.0),
+            limits=HTTP_LIMITS,
+            http2=HTTP2_AVAILABLE
+        )
+    return EXTERNAL_HTTP
+
+def get_twilio_http() -> httpx.AsyncClient:
+    """Return the shared client for Twilio media downloads, creating it on first use"""
+    global TWILIO_HTTP
+    if TWILIO_HTTP is None or TWILIO_HTTP.is_closed:
+        TWILIO_HTTP = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=3.0, pool=5.0),
+            limits=HTTP_LIMITS,
+            http2=HTTP2_AVAILABLE
+        )
+    return TWILIO_HTTP
+
+async def close_http_clients():
+    """Close the shared HTTP clients on application shutdown"""
+    for client in (EXTERNAL_HTTP, TWILIO_HTTP):
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+router.add_event_handler("shutdown", close_http_clients)
+
+# Twilio signs the webhook URL followed by every form key+value in key order, using HMAC-SHA1
+# keyed by the auth token. Both port variants of the URL are accepted, as in the SDK.
+_parsed_webhook_url = urlparse(config.webhook_url)
+SIGNED_WEBHOOK_URLS = tuple(dict.fromkeys((remove_port(_parsed_webhook_url), add_port(_parsed_webhook_url))))
+TWILIO_HMAC = hmac.new(config.twilio_auth_token.encode("utf-8"), digestmod=hashlib.sha1) if config.twilio_auth_token else None
+# SDK validator for the TWILIO_SDK_SIGNATURE_VALIDATION fallback, built once
+TWILIO_VALIDATOR = RequestValidator(config.twilio_auth_token) if config.twilio_auth_token else None
+
+def compute_twilio_signature(url: str, form_dict: dict) -> bytes:
+    """Compute the base64 X-Twilio-Signature Twilio would send for this URL and form"""
+    mac = TWILIO_HMAC.copy()
+    mac.update("".join([url, *(key + form_dict[key] for key in sorted(form_dict))]).encode("utf-8"))
+    return base64.b64encode(mac.digest())
+
+def validate_twilio_signature(form_dict: dict, signature: str) -> bool:
+    """Check a webhook's X-Twilio-Signature against the configured webhook URL in constant time"""
+    if not signature or TWILIO_HMAC is None:
+        return False
+    signature_bytes = signature.encode("utf-8")
+    return any(
+        hmac.compare_digest(compute_twilio_signature(url, form_dict), signature_bytes)
+        for url in SIGNED_WEBHOOK_URLS
+    )
 
 def validate_media_type(content_type: str) -> bool:
     """Validate if the media type is supported"""
     if not content_type:
         return False
-    return content_type.lower() in SUPPORTED_MEDIA_TYPES
+    # Twilio sends lowercase types, so only allocate a lowered copy when the exact lookup misses
+    return content_type in SUPPORTED_MEDIA_TYPES or content_type.lower() in SUPPORTED_MEDIA_TYPES
 
 def validate_twilio_message_format(form_data: dict) -> dict:
     """
     Validate and extract standard Twilio webhook fields.
     Returns a dict with validation results and extracted data.
     """
-    validation = {
-        "is_valid": True,
-        "warnings": [],
-        "errors": []
-    }
+    warnings = []
     
     # Required fields check
-    required_fields = ["From", "MessageSid"]
-    for field in required_fields:
-        if not form_data.get(field):
-            validation["errors"].append(f"Missing required field: {field}")
-            validation["is_valid"] = False
+    errors = [f"Missing required field: {field}" for field in ("From", "MessageSid") if not form_data.get(field)]
     
     # Message SID format validation
     message_sid = form_data.get("MessageSid", "")
-    if message_sid and not (message_sid.startswith("SM") or message_sid.startswith("MM")):
-        validation["warnings"].append(f"Unexpected MessageSid format: {message_sid}")
+    sid_prefix = message_sid[:2]
+    if message_sid and sid_prefix != "SM" and sid_prefix != "MM":
+        warnings.append(f"Unexpected MessageSid format: {message_sid}")
     
-    # NumMedia validation
+    # NumMedia validation (parsed once; an unparseable value counts as no media)
+    num_media_raw = form_data.get("NumMedia", 0)
     try:
-        num_media = int(form_data.get("NumMedia", 0))
-        if num_media < 0:
-            validation["warnings"].append(f"Negative NumMedia value: {num_media}")
+        num_media = int(num_media_raw)
     except (ValueError, TypeError):
-        validation["warnings"].append(f"Invalid NumMedia value: {form_data.get('NumMedia')}")
+        warnings.append(f"Invalid NumMedia value: {num_media_raw}")
+        num_media = 0
+    if num_media < 0:
+        warnings.append(f"Negative NumMedia value: {num_media}")
     
     # Check for unexpected MMS/SMS mismatch
-    is_mms_sid = message_sid.startswith("MM")
-    has_media = int(form_data.get("NumMedia", 0)) > 0
-    if is_mms_sid != has_media:
-        validation["warnings"].append(f"Message type mismatch: SID suggests {'MMS' if is_mms_sid else 'SMS'} but NumMedia={form_data.get('NumMedia', 0)}")
+    is_mms_sid = sid_prefix == "MM"
+    if is_mms_sid != (num_media > 0):
+        warnings.append(f"Message type mismatch: SID suggests {'MMS' if is_mms_sid else 'SMS'} but NumMedia={num_media_raw}")
     
-    return validation
+    return {
+        "is_valid": not errors,
+        "warnings": warnings,
+        "errors": errors,
+        "num_media": num_media
+    }
+
+def is_twilio_media_url(media_url: str) -> bool:
+    """Check that a URL points at Twilio's media host over HTTPS, with no port or credentials in it"""
+    parsed = urlparse(media_url)
+    return parsed.scheme == "https" and parsed.netloc in TWILIO_MEDIA_HOSTS
+
+async def stream_media_file(media_url: str, account_sid: str, auth_token: str) -> AsyncIterator[bytes]:
+    """
+    Stream a media file from a Twilio URL with authentication, chunk by chunk.
+    Holds a MEDIA_SEM slot until the stream is consumed.
+    Raises httpx errors if the download fails.
+    """
+    async with MEDIA_SEM, get_twilio_http().stream(
+        "GET",
+        media_url,
+        auth=(account_sid, auth_token)  # HTTP Basic Auth
+    ) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            yield chunk
 
-async def download_media_file(media_url: str, account_sid: str, auth_token: str) -> Optional[bytes]:
+async def measure_media_file(media_url: str, account_sid: str, auth_token: str) -> Optional[int]:
     """
-    Download media file from Twilio URL with authentication.
-    Returns the file content as bytes or None if failed.
+    Download media file from Twilio URL without holding it in memory.
+    Returns the size in bytes or None if failed.
     """
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                media_url,
-                auth=(account_sid, auth_token)  # HTTP Basic Auth
-            )
-            response.raise_for_status()
-            return response.content
+        size = 0
+        async for chunk in stream_media_file(media_url, account_sid, auth_token):
+            size += len(chunk)
+        return size
     except Exception as e:
-        logger.error(f"Failed to download media from {media_url}: {str(e)}")
+        logger.error("Failed to download media from %s: %s", media_url, e)
         return None
 
-@lru_cache(maxsize=100)
+# Messages forwarded in the last hour, keyed by MessageSid; Twilio redelivers webhooks it thinks failed
+processed_messages: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+
 def get_cached_response(message_id: str) -> Optional[dict]:
-    """Cache successful responses to avoid duplicate processing"""
-    return None
+    """Return the recorded outcome if this message was already forwarded, to avoid duplicate processing"""
+    return processed_messages.get(message_id)
+
+class ForwardRejectedError(Exception):
+    """The external API rejected a message with a 4xx (other than 429); retrying won't help"""
 
 async def forward_message(payload: dict, headers: dict, retry_count: int = 0) -> bool:
-    """Forward message to external API with retry logic"""
-    try:
-        logger.info(f"=== Forwarding Message to External API ===")
-        logger.info(f"Endpoint: {config.external_endpoint}")
-        logger.info(f"Payload: {json.dumps(payload, indent=2)}")
-        logger.info(f"Headers: {json.dumps({k: v for k, v in headers.items() if k.lower() != 'authorization'}, indent=2)}")
-        
-        async with httpx.AsyncClient(timeout=config.request_timeout) as client:
-            logger.info(f"Making request to {config.external_endpoint}")
-            response = await client.post(config.external_endpoint, json=payload, headers=headers)
-            logger.info(f"Response status: {response.status_code}")
-            logger.info(f"Response body: {response.text}")
+    """
+    Forward message to external API, retrying with exponential backoff.
+    Raises ForwardRejectedError if the external API rejects the message outright.
+    """
+    message_sid = payload.get("message_sid")
+    # Serialize once for every attempt; headers already carry Content-Type: application/json
+    body = orjson.dumps(payload)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Payload: %s", body.decode("utf-8"))
+        logger.debug("Headers: %s", {k: v for k, v in headers.items() if k.lower() != 'authorization'})
+    
+    # Always make at least one attempt, even for messages already past max_retries
+    last_attempt = max(retry_count, config.max_retries)
+    for attempt in range(retry_count, last_attempt + 1):
+        try:
+            response = await get_external_http().post(config.external_endpoint, content=body, headers=headers)
+            logger.info(
+                "External API responded %s for %s",
+                response.status_code, message_sid,
+                extra={
+                    "sms_sid": message_sid,
+                    "endpoint": config.external_endpoint,
+                    "status_code": response.status_code,
+                    "http_version": response.http_version,
+                    "attempt": attempt
+                }
+            )
+            logger.debug("Response body: %s", response.text)
             response.raise_for_status()
-            logger.info(f"External API response: {response.status_code}")
             return True
-    except httpx.ConnectError as e:
-        logger.error(f"Connection error: {str(e)}")
-        if retry_count < config.max_retries:
-            logger.warning(f"Retry {retry_count + 1}/{config.max_retries} for message forwarding: Connection error")
-            await asyncio.sleep(config.retry_delay * (retry_count + 1))  # Exponential backoff
-            return await forward_message(payload, headers, retry_count + 1)
-        else:
-            logger.error(f"Failed to forward message after {config.max_retries} retries: Connection error")
-            return False
-    except httpx.TimeoutException as e:
-        logger.error(f"Timeout error: {str(e)}")
-        if retry_count < config.max_retries:
-            logger.warning(f"Retry {retry_count + 1}/{config.max_retries} for message forwarding: Timeout")
-            await asyncio.sleep(config.retry_delay * (retry_count + 1))
-            return await forward_message(payload, headers, retry_count + 1)
-        else:
-            logger.error(f"Failed to forward message after {config.max_retries} retries: Timeout")
-            return False
-    except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error {e.response.status_code}: {str(e)}")
-        logger.error(f"Response body: {e.response.text}")
-        if retry_count < config.max_retries:
-            logger.warning(f"Retry {retry_count + 1}/{config.max_retries} for message forwarding: HTTP {e.response.status_code}")
-            await asyncio.sleep(config.retry_delay * (retry_count + 1))
-            return await forward_message(payload, headers, retry_count + 1)
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
+            if 400 <= status_code < 500 and status_code != 429:
+                raise ForwardRejectedError(f"External API rejected message {message_sid}: HTTP {status_code}") from e
+            reason = f"HTTP {status_code}"
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            reason = type(e).__name__
+        except Exception as e:
+            reason = repr(e)
+        logger.warning(
+            "Forward attempt %d/%d failed: %s", attempt + 1, last_attempt + 1, reason,
+            extra={"sms_sid": message_sid}
+        )
+        
+        if attempt < last_attempt:
+            # Exponential backoff, jittered so concurrent failures don't retry in lockstep
+            delay = min(FORWARD_RETRY_MAX_DELAY, config.retry_delay * (2 ** attempt))
+            await asyncio.sleep(delay + random.uniform(0, config.retry_delay))
+    
+    logger.error("Failed to forward message after %d retries: %s", config.max_retries, reason, extra={"sms_sid": message_sid})
+    return False
+
+async def forward_message_bounded(payload: dict, headers: dict, retry_count: int = 0) -> bool:
+    """Forward a message once a forwarding slot is free"""
+    if FORWARD_SEM.locked():
+        logger.warning("All %d forwarding slots busy, waiting", config.max_inflight)
+    async with FORWARD_SEM:
+        return await forward_message(payload, headers, retry_count)
+
+def schedule_retry(message_data: dict, delay: float):
+    """Push a message onto the retry heap, due in delay seconds, and wake the worker"""
+    heapq.heappush(retry_heap, (time.monotonic() + delay, next(retry_sequence), message_data))
+    retry_wakeup.set()
+
+def queue_failed_message(message_sid: str, payload: dict, headers: dict) -> bool:
+    """Queue a message for background retry; returns False if the retry queue is full"""
+    start_retry_worker()
+    if len(retry_heap) >= retry_heap_limit:
+        logger.error("Retry queue full, dropping message %s", message_sid, extra={"sms_sid": message_sid})
+        retry_stats["dropped"] += 1
+        return False
+    schedule_retry({
+        "message_sid": message_sid,
+        "payload": payload,
+        "headers": headers,
+        "timestamp": time.monotonic(),
+        "retry_count": 0
+    }, FAILED_RETRY_BASE_DELAY)
+    return True
+
+async def retry_message(message_data: dict):
+    """Make one retry attempt for a queued message, rescheduling it with backoff if it fails again"""
+    message_sid = message_data["message_sid"]
+    try:
+        if time.monotonic() - message_data["timestamp"] > FAILED_MESSAGE_TTL:
+            logger.error("Giving up on message %s after %d retries", message_sid, message_data["retry_count"], extra={"sms_sid": message_sid})
+            retry_stats["dropped"] += 1
+            return
+        
+        # One attempt per pass; the heap provides the backoff between passes
+        success = await forward_message_bounded(
+            message_data["payload"],
+            message_data["headers"],
+            config.max_retries
+        )
+        
+        if success:
+            retry_stats["retried"] += 1
+            processed_messages[message_sid] = {"forwarded_at": utc_timestamp()}
+            logger.info("Successfully retried message %s", message_sid, extra={"sms_sid": message_sid})
         else:
-            logger.error(f"Failed to forward message after {config.max_retries} retries: HTTP {e.response.status_code}")
-            return False
+            message_data["retry_count"] += 1
+            backoff = min(FAILED_RETRY_BASE_DELAY * (2 ** message_data["retry_count"]), FAILED_RETRY_MAX_DELAY)
+            schedule_retry(message_data, backoff + random.uniform(0, FAILED_RETRY_BASE_DELAY))
+    except ForwardRejectedError as e:
+        logger.error("%s; dropping it from the retry queue", e, extra={"sms_sid": message_sid})
+        retry_stats["dropped"] += 1
+
+async def retry_worker():
+    """Retry queued messages with exponential backoff, dropping any older than 24 hours"""
+    while True:
+        # Sleep until the earliest retry is due, or until a new message is queued
+        retry_wakeup.clear()
+        if not retry_heap:
+            await retry_wakeup.wait()
+            continue
+        now = time.monotonic()
+        delay = retry_heap[0][0] - now
+        if delay > 0:
+            try:
+                await asyncio.wait_for(retry_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        # Retry a batch of due messages concurrently rather than one round trip at a time
+        batch = []
+        while retry_heap and retry_heap[0][0] <= now and len(batch) < RETRY_BATCH_SIZE:
+            batch.append(heapq.heappop(retry_heap)[2])
+        results = await asyncio.gather(*(retry_message(message_data) for message_data in batch), return_exceptions=True)
+        for result in results:
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            if isinstance(result, Exception):
+                logger.error("Error in SMS retry worker: %s", result)
+
+def start_retry_worker():
+    """Start the background retry worker if it isn't running"""
+    global retry_worker_task
+    if retry_worker_task is None or retry_worker_task.done():
+        retry_worker_task = asyncio.create_task(retry_worker())
+
+async def stop_retry_worker():
+    """Cancel the background retry worker on application shutdown"""
+    if retry_worker_task is not None:
+        retry_worker_task.cancel()
+
+router.add_event_handler("startup", start_retry_worker)
+router.add_event_handler("shutdown", stop_retry_worker)
+
+async def forward_and_record(message_sid: str, payload: dict, headers: dict):
+    """Forward a message, queueing it for background retry if forwarding fails"""
+    try:
+        success = await forward_message_bounded(payload, headers)
+    except ForwardRejectedError as e:
+        # Not retryable; keep the SID recorded so redeliveries aren't forwarded either
+        logger.error("%s", e, extra={"sms_sid": message_sid})
+        return
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        if retry_count < config.max_retries:
-            logger.warning(f"Retry {retry_count + 1}/{config.max_retries} for message forwarding: {str(e)}")
-            await asyncio.sleep(config.retry_delay * (retry_count + 1))
-            return await forward_message(payload, headers, retry_count + 1)
-        else:
-            logger.error(f"Failed to forward message after {config.max_retries} retries: {str(e)}")
-            return False
+        logger.error("Error forwarding message %s: %s", message_sid, e, extra={"sms_sid": message_sid})
+        success = False
+    
+    if success:
+        # Cache successful response
+        processed_messages[message_sid] = {"forwarded_at": utc_timestamp()}
+        logger.info("Successfully forwarded message %s", message_sid, extra={"sms_sid": message_sid})
+    elif queue_failed_message(message_sid, payload, headers):
+        logger.warning("Failed to forward message %s, queued for retry", message_sid, extra={"sms_sid": message_sid})
+    else:
+        # Dropped; forget the SID so Twilio's redelivery of this webhook is forwarded instead of skipped
+        processed_messages.pop(message_sid, None)
 
 @router.post("/receive")
 async def receive_sms(request: Request) -> Response:
@@ -217,122 +487,123 @@ async def receive_sms(request: Request) -> Response:
     Receive incoming SMS messages and forward them securely.
     Includes caching and retry logic for external API failures.
     """
-    resp = MessagingResponse()
-
     try:
-        # Get the raw request body for Twilio validation
-        body = await request.body()
-        form_data = await request.form()
+        # Snapshot the form once; FormData lookups scan a multidict
+        form_dict = dict(await request.form())
         
         # Log incoming request details
-        logger.info("=== Incoming SMS/MMS Webhook Request ===")
-        logger.info(f"Request URL: {request.url}")
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"Request body: {body}")
-        logger.info(f"Form data: {dict(form_data)}")
+        logger.info("Incoming SMS/MMS webhook %s %s", request.method, request.url.path, extra={"sms_sid": form_dict.get("MessageSid")})
+        logger.debug("Request headers: %s", request.headers)
+        logger.debug("Form data: %s", form_dict)
         
         # Validate Twilio webhook format
-        validation = validate_twilio_message_format(dict(form_data))
+        validation = validate_twilio_message_format(form_dict)
         if not validation["is_valid"]:
-            logger.error(f"Invalid Twilio webhook format: {validation['errors']}")
-            return Response(content=str(resp), media_type="application/xml", status_code=400)
+            logger.error("Invalid Twilio webhook format: %s", validation["errors"])
+            return Response(content=EMPTY_TWIML, media_type="application/xml", status_code=400)
         
         if validation["warnings"]:
             for warning in validation["warnings"]:
-                logger.warning(f"Webhook validation warning: {warning}")
+                logger.warning("Webhook validation warning: %s", warning)
         
         # Validate the request is from Twilio using API Key authentication
         # Skip validation in test mode
         if config.test_mode:
-            logger.info("=== TEST MODE: Skipping Twilio signature validation ===")
+            logger.debug("TEST MODE: Skipping Twilio signature validation")
             is_valid = True
         else:
             if not config.twilio_account_sid or not config.twilio_auth_token:
                 logger.error("Missing Twilio API credentials")
                 raise HTTPException(status_code=500, detail="Server configuration error")
 
-            validator = RequestValidator(config.twilio_auth_token)  # Use API Secret for validation
-            
             # Use configured webhook URL for validation
             url = config.webhook_url
             
             signature = request.headers.get("X-Twilio-Signature", "")
+            if not signature:
+                # Not from Twilio; don't spend an HMAC (or a worker thread) on it
+                logger.warning(
+                    "Missing Twilio signature for request from %s",
+                    request.client.host if request.client else None
+                )
+                return Response(content=EMPTY_TWIML, media_type="application/xml", status_code=403)
             
-            # Get the form data as a dict for validation
-            form_dict = dict(form_data)
-            
-            # Debug logging for validation
-            logger.info("=== Twilio Validation Details ===")
-            logger.info(f"URL for validation: {url}")
-            logger.info(f"Received signature: {signature}")
-            logger.info(f"Form data for validation: {form_dict}")
-            logger.info(f"Auth token present: {bool(config.twilio_auth_token)}")
-            logger.info(f"Auth token length: {len(config.twilio_auth_token) if config.twilio_auth_token else 0}")
-            
-            # Calculate expected signature for debugging
-            expected_signature = validator.compute_signature(url, form_dict)
-            logger.info(f"Expected signature: {expected_signature}")
-            logger.info(f"Signature match: {signature == expected_signature}")
+            # Debug logging for validation (formatted lazily, only when debug logging is on)
+            logger.debug(
+                "Twilio validation details: url=%s signature_present=%s params=%d",
+                url, bool(signature), len(form_dict)
+            )
             
             # Validate the request
-            is_valid = validator.validate(url, form_dict, signature)
-            logger.info(f"Validation result: {'Valid' if is_valid else 'Invalid'}")
-            
+            if config.use_sdk_validator:
+                is_valid = await asyncio.to_thread(TWILIO_VALIDATOR.validate, url, form_dict, signature)
+            else:
+                is_valid = validate_twilio_signature(form_dict, signature)
             if not is_valid:
-                logger.warning(f"Invalid Twilio signature for request from {request.client.host}")
-                logger.warning(f"Validation failed with URL: {url}")
-                return Response(content=str(resp), media_type="application/xml", status_code=403)
-
-        message_body = form_data.get("Body", "")
-        from_number = form_data.get("From", "")
-        to_number = form_data.get("To", "")
-        message_sid = form_data.get("MessageSid", "")  # Twilio's unique message ID
-        account_sid = form_data.get("AccountSid", "")
-        api_version = form_data.get("ApiVersion", "")
-        message_status = form_data.get("SmsStatus", form_data.get("MessageStatus", ""))  # Could be SmsStatus or MessageStatus
+                logger.warning(
+                    "Invalid Twilio signature for request from %s (validated against %s)",
+                    request.client.host if request.client else None, url
+                )
+                return Response(content=EMPTY_TWIML, media_type="application/xml", status_code=403)
+
+        message_sid = form_dict.get("MessageSid", "")  # Twilio's unique message ID
+        
+        # Check cache first: a redelivered webhook for a message we already forwarded is a no-op
+        cached_response = get_cached_response(message_sid)
+        if cached_response:
+            logger.info("Using cached response for message %s", message_sid, extra={"sms_sid": message_sid})
+            return Response(content=EMPTY_TWIML, media_type="application/xml")
+
+        message_body = form_dict.get("Body", "")
+        from_number = form_dict.get("From", "")
+        to_number = form_dict.get("To", "")
+        account_sid = form_dict.get("AccountSid", "")
+        api_version = form_dict.get("ApiVersion", "")
+        message_status = form_dict.get("SmsStatus", form_dict.get("MessageStatus", ""))  # Could be SmsStatus or MessageStatus
         
         # Validate Message SID format based on Twilio documentation
         # SMS messages start with SM, MMS messages start with MM
-        is_mms_by_sid = message_sid.startswith("MM") if message_sid else False
-        is_sms_by_sid = message_sid.startswith("SM") if message_sid else False
+        sid_prefix = message_sid[:2]
+        is_mms_by_sid = sid_prefix == "MM"
+        is_sms_by_sid = sid_prefix == "SM"
         
-        # Extract MMS fields
-        num_media = int(form_data.get("NumMedia", 0))
-        media = []
-        unsupported_media = []
+        # Extract MMS fields (NumMedia was already parsed during format validation)
+        num_media = validation["num_media"]
+        form_get = form_dict.get
+        all_media = []
+        supported_count = 0
         
         for i in range(num_media):
-            media_url = form_data.get(f"MediaUrl{i}")
-            media_type = form_data.get(f"MediaContentType{i}")
-            if media_url:
-                if validate_media_type(media_type):
-                    media.append({
-                        "url": media_url,
-                        "content_type": media_type,
-                        "index": i,
-                        "supported": True
-                    })
-                else:
-                    unsupported_media.append({
-                        "url": media_url,
-                        "content_type": media_type,
-                        "index": i,
-                        "supported": False
-                    })
-                    logger.warning(f"Unsupported media type: {media_type} for media {i}")
+            url_key, type_key = MEDIA_FIELD_KEYS[i] if i < MAX_MEDIA_PER_MESSAGE else (f"MediaUrl{i}", f"MediaContentType{i}")
+            media_url = form_get(url_key)
+            if not media_url:
+                continue
+            media_type = form_get(type_key)
+            supported = validate_media_type(media_type)
+            all_media.append({
+                "url": media_url,
+                "content_type": media_type,
+                "index": i,
+                "supported": supported
+            })
+            if supported:
+                supported_count += 1
+            else:
+                logger.warning("Unsupported media type: %s for media %d", media_type, i)
         
-        # Include all media (supported and unsupported) in the final list
-        all_media = media + unsupported_media
+        # Supported media first, then unsupported (stable, so each group keeps its index order)
+        if supported_count < len(all_media):
+            all_media.sort(key=lambda item: not item["supported"])
+        unsupported_count = len(all_media) - supported_count
         
         # Determine message type using multiple indicators (more robust)
         has_media = num_media > 0
         
         # Validate consistency between NumMedia and MessageSid format
         if has_media and is_sms_by_sid:
-            logger.warning(f"Inconsistency: NumMedia={num_media} but MessageSid starts with SM: {message_sid}")
+            logger.warning("Inconsistency: NumMedia=%d but MessageSid starts with SM: %s", num_media, message_sid)
         elif not has_media and is_mms_by_sid:
-            logger.warning(f"Inconsistency: NumMedia=0 but MessageSid starts with MM: {message_sid}")
+            logger.warning("Inconsistency: NumMedia=0 but MessageSid starts with MM: %s", message_sid)
         
         # Primary determination by NumMedia, secondary by SID pattern
         if has_media or is_mms_by_sid:
@@ -340,27 +611,22 @@ async def receive_sms(request: Request) -> Response:
         else:
             message_type = "SMS"
         
-        logger.info(f"=== Message Details ===")
-        logger.info(f"MessageSid: {message_sid} (Type: {message_type})")
-        logger.info(f"From: {from_number}")
-        logger.info(f"To: {to_number}")
-        logger.info(f"AccountSid: {account_sid}")
-        logger.info(f"Status: {message_status}")
-        logger.info(f"ApiVersion: {api_version}")
-        logger.info(f"Body: {message_body}")
-        logger.info(f"NumMedia: {num_media}")
-        logger.info(f"Supported media items: {len(media)}")
-        logger.info(f"Unsupported media items: {len(unsupported_media)}")
-        if all_media:
-            for media_item in all_media:
-                status = "✓" if media_item['supported'] else "✗"
-                logger.info(f"Media {media_item['index']} {status}: {media_item['content_type']} - {media_item['url']}")
-
-        # Check cache first
-        cached_response = get_cached_response(message_sid)
-        if cached_response:
-            logger.info(f"Using cached response for message {message_sid}")
-            return Response(content=str(resp), media_type="application/xml")
+        logger.info(
+            "Received %s %s from %s to %s with %d media (%d supported)",
+            message_type, message_sid, from_number, to_number, num_media, supported_count,
+            extra={
+                "sms_sid": message_sid,
+                "message_type": message_type,
+                "account_sid": account_sid,
+                "message_status": message_status,
+                "api_version": api_version,
+                "num_media": num_media,
+                "supported_media": supported_count,
+                "unsupported_media": unsupported_count
+            }
+        )
+        logger.debug("Body: %s", message_body)
+        logger.debug("Media: %s", all_media)
 
         # Build Twilio-compatible payload with all standard fields
         payload = {
@@ -373,7 +639,7 @@ async def receive_sms(request: Request) -> Response:
             "api_version": api_version,
             "status": message_status,
             "direction": "inbound",  # Webhook messages are always inbound
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": utc_timestamp(),
             
             # Message type and media info
             "message_type": message_type,
@@ -388,8 +654,8 @@ async def receive_sms(request: Request) -> Response:
                 "phoneNumber": from_number,
                 "messageType": message_type,
                 "mediaCount": num_media,
-                "supportedMediaCount": len(media),
-                "unsupportedMediaCount": len(unsupported_media),
+                "supportedMediaCount": supported_count,
+                "unsupportedMediaCount": unsupported_count,
                 "twilioAccountSid": account_sid,
                 "twilioApiVersion": api_version,
                 "messageStatus": message_status
@@ -402,90 +668,45 @@ async def receive_sms(request: Request) -> Response:
                 "note": "Media URLs expire after a few hours. Download immediately if needed."
             }
         }
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {config.external_api_key}"
-        }
+        headers = FORWARD_HEADERS
 
-        # Log the forwarding attempt
-        logger.info(f"=== Forwarding Message ===")
-        logger.info(f"Forwarding to: {config.external_endpoint}")
-        logger.info(f"Message Type: {message_type}")
-        if all_media:
-            logger.info(f"Total Media Items: {len(all_media)} (Supported: {len(media)}, Unsupported: {len(unsupported_media)})")
-            for media_item in all_media:
-                status = "✓" if media_item['supported'] else "✗"
-                logger.info(f"  {status} {media_item['content_type']}: {media_item['url']}")
-        logger.info(f"Payload: {json.dumps(payload, indent=2)}")
-        logger.info(f"Headers: {json.dumps({k: v for k, v in headers.items() if k.lower() != 'authorization'}, indent=2)}")
-        
         # Note: Twilio media URLs expire after a few hours
         # If long-term storage is needed, download immediately
 
-        # Attempt to forward the message
-        success = await forward_message(payload, headers)
-        
-        if success:
-            # Cache successful response
-            get_cached_response.cache_clear()  # Clear old cache entries
-            get_cached_response(message_sid)
-            logger.info(f"Successfully forwarded message {message_sid}")
-            return Response(content=str(resp), media_type="application/xml")
-        else:
-            # Store failed message for later retry
-            failed_messages[message_sid] = {
-                "payload": payload,
-                "headers": headers,
-                "timestamp": datetime.utcnow(),
-                "retry_count": 0
-            }
-            logger.warning(f"Failed to forward message {message_sid}, stored for retry")
-            return Response(content=str(resp), media_type="application/xml", status_code=202)  # Accepted but not processed
+        # Every accepted message either forwards or lands on the retry heap, so refuse new ones while
+        # those two are full; Twilio retries a 503 later instead of us dropping the message
+        if len(retry_heap) + len(forward_tasks) >= retry_heap_limit:
+            logger.warning(
+                "SMS backlog full (%d queued for retry, %d forwarding), rejecting message %s",
+                len(retry_heap), len(forward_tasks), message_sid, extra={"sms_sid": message_sid}
+            )
+            return Response(content=EMPTY_TWIML, media_type="application/xml", status_code=503)
+
+        # Forward in the background so Twilio gets its response without waiting on the external API.
+        # Recording the SID up front also stops a redelivery from forwarding it a second time.
+        processed_messages[message_sid] = {"accepted_at": utc_timestamp()}
+        task = asyncio.create_task(forward_and_record(message_sid, payload, headers))
+        forward_tasks.add(task)
+        task.add_done_callback(forward_tasks.discard)
+        return Response(content=EMPTY_TWIML, media_type="application/xml", status_code=202)  # Accepted, forwarding in background
 
     except HTTPException as he:
-        logger.error(f"HTTP Exception: {str(he)}")
+        logger.error("HTTP Exception: %s", he)
         raise he
     except Exception as e:
-        logger.error(f"Error processing SMS: {str(e)}")
-        return Response(content=str(resp), media_type="application/xml", status_code=500)
+        logger.error("Error processing SMS: %s", e)
+        return Response(content=EMPTY_TWIML, media_type="application/xml", status_code=500)
 
 @router.get("/retry-failed")
 async def retry_failed_messages() -> dict:
     """
-    Endpoint to manually trigger retry of failed messages.
-    This could be called by a scheduled task or manually.
+    Report on the background retry of failed messages.
+    Retries run automatically; this endpoint only returns queue stats.
     """
-    retried = 0
-    failed = 0
-    current_time = datetime.utcnow()
-    
-    for message_sid, message_data in list(failed_messages.items()):
-        # Skip messages older than 24 hours
-        if current_time - message_data["timestamp"] > timedelta(hours=24):
-            del failed_messages[message_sid]
-            continue
-            
-        if message_data["retry_count"] >= config.max_retries:
-            failed += 1
-            continue
-            
-        success = await forward_message(
-            message_data["payload"],
-            message_data["headers"],
-            message_data["retry_count"]
-        )
-        
-        if success:
-            retried += 1
-            del failed_messages[message_sid]
-        else:
-            message_data["retry_count"] += 1
-            failed += 1
-    
     return {
-        "retried": retried,
-        "failed": failed,
-        "remaining": len(failed_messages)
+        "retried": retry_stats["retried"],
+        "failed": retry_stats["dropped"],
+        "remaining": len(retry_heap)
     }
 
 @router.get("/download-media")
@@ -497,15 +718,15 @@ async def download_media(media_url: str) -> dict:
     if not config.twilio_account_sid or not config.twilio_auth_token:
         raise HTTPException(status_code=500, detail="Twilio credentials not configured")
     
-    if not media_url.startswith("https://api.twilio.com/"):
+    if not is_twilio_media_url(media_url):
         raise HTTPException(status_code=400, detail="Invalid Twilio media URL")
     
     try:
-        media_content = await download_media_file(media_url, config.twilio_account_sid, config.twilio_auth_token)
-        if media_content:
+        media_size = await measure_media_file(media_url, config.twilio_account_sid, config.twilio_auth_token)
+        if media_size:
             return {
                 "success": True,
-                "size_bytes": len(media_content),
+                "size_bytes": media_size,
                 "message": "Media downloaded successfully"
             }
         else:
@@ -517,12 +738,39 @@ async def download_media(media_url: str) -> dict:
         logger.error(f"Error in download_media endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
+@media_router.get("/download-all-media")
+async def download_all_media_endpoint(media_url: List[str] = Query(...)) -> dict:
+    """
+    Endpoint to download every attachment of an MMS (up to MAX_MEDIA_PER_MESSAGE Twilio media URLs)
+    concurrently, at most SMS_MAX_MEDIA_DOWNLOADS at a time. Requires an authenticated user.
+    """
+    if not config.twilio_account_sid or not config.twilio_auth_token:
+        raise HTTPException(status_code=500, detail="Twilio credentials not configured")
+    
+    if len(media_url) > MAX_MEDIA_PER_MESSAGE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_MEDIA_PER_MESSAGE} media URLs per request")
+    
+    if not all(is_twilio_media_url(url) for url in media_url):
+        raise HTTPException(status_code=400, detail="Invalid Twilio media URL")
+    
+    media_sizes = await asyncio.gather(
+        *(measure_media_file(url, config.twilio_account_sid, config.twilio_auth_token) for url in media_url)
+    )
+    results = [
+        {"url": url, "success": size is not None, "size_bytes": size or 0}
+        for url, size in zip(media_url, media_sizes)
+    ]
+    return {
+        "downloaded": sum(1 for result in results if result["success"]),
+        "results": results
+    }
+
 @router.get("/supported-media-types")
 async def get_supported_media_types() -> dict:
     """
     Endpoint to get the list of supported media types for MMS.
     """
     return {
-        "supported_types": sorted(list(SUPPORTED_MEDIA_TYPES)),
+        "supported_types": SUPPORTED_MEDIA_TYPES_SORTED,
         "count": len(SUPPORTED_MEDIA_TYPES)
     } 
\ No newline at end of file
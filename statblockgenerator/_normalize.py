@@ -0,0 +1,75 @@
+"""
+StatBlock list-item ID normalization
+
+Kept free of FastAPI/Firestore imports and fully annotated so it can be
+compiled ahead of time with mypyc (mypyc statblockgenerator/_normalize.py);
+the pure-Python module is used when no compiled build is present.
+"""
+
+import os
+from typing import Any, Dict, List, Tuple
+
+# Pre-generated UUID4 strings for list item IDs, refilled in batches
+_UUID_POOL_BATCH: int = 256
+_uuid_pool: List[str] = []
+
+# Paths (from the statblock root) of every list whose items need stable IDs
+_ID_LIST_PATHS: Tuple[Tuple[str, ...], ...] = (
+    ("actions",),
+    ("bonusActions",),
+    ("reactions",),
+    ("specialAbilities",),
+    ("spells", "cantrips"),
+    ("spells", "knownSpells"),
+    ("legendaryActions", "actions"),
+    ("lairActions", "actions"),
+)
+
+
+def _format_uuid4(hex_digits: str) -> str:
+    """
+    Format 32 random hex digits as a UUID4 string
+    Same result as str(uuid.UUID(bytes=..., version=4)) without building a UUID object
+    """
+    variant = "89ab"[int(hex_digits[16], 16) & 0x3]
+    return (
+        f"{hex_digits[0:8]}-{hex_digits[8:12]}-4{hex_digits[13:16]}-"
+        f"{variant}{hex_digits[17:20]}-{hex_digits[20:32]}"
+    )
+
+
+def _next_uuid() -> str:
+    """Return a random UUID4 string, refilling the pool from a single os.urandom call"""
+    if not _uuid_pool:
+        random_hex = os.urandom(16 * _UUID_POOL_BATCH).hex()
+        _uuid_pool.extend(
+            _format_uuid4(random_hex[i:i + 32])
+            for i in range(0, len(random_hex), 32)
+        )
+    return _uuid_pool.pop()
+
+
+def normalize_statblock_ids(statblock: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Phase 3 Task 7: Ensure all list items have stable IDs
+    Backend ID generation with frontend fallback support
+    
+    Items are updated in place; lists whose items already have IDs are left untouched.
+    """
+    for path in _ID_LIST_PATHS:
+        # Sections are usually present, so index directly and treat a miss as "nothing to do"
+        items: Any = statblock
+        try:
+            for key in path:
+                items = items[key]
+        except (KeyError, TypeError):
+            continue
+        
+        if not isinstance(items, list):
+            continue
+        
+        for item in items:
+            if not item.get("id"):
+                item["id"] = _next_uuid()
+    
+    return statblock
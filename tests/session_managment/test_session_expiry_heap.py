@@ -0,0 +1,46 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from session_management import EnhancedGlobalSessionManager, EXPIRY_HEAP_SLACK
+
+
+def heap_limit(manager):
+    return 2 * len(manager.sessions) + EXPIRY_HEAP_SLACK
+
+
+class TestExpiryHeapBounds:
+    def test_heap_bounded_after_eviction(self):
+        manager = EnhancedGlobalSessionManager(max_sessions=100)
+        for _ in range(5000):
+            manager.create_session()
+        assert len(manager.sessions) == 100
+        assert len(manager._expiry_heap) <= heap_limit(manager)
+
+    def test_heap_bounded_after_deletion(self):
+        manager = EnhancedGlobalSessionManager(max_sessions=1000)
+        session_ids = [manager.create_session() for _ in range(1000)]
+        for session_id in session_ids[:990]:
+            assert manager.delete_session(session_id)
+        assert len(manager.sessions) == 10
+        assert len(manager._expiry_heap) <= heap_limit(manager)
+
+    def test_heap_bounded_after_expired_access(self):
+        manager = EnhancedGlobalSessionManager(max_sessions=1000)
+        session_ids = [manager.create_session() for _ in range(500)]
+        for session_id in session_ids:
+            manager.sessions[session_id].expires_at = datetime.now() - timedelta(seconds=1)
+            assert manager.get_session(session_id) is None
+        assert manager.sessions == {}
+        assert len(manager._expiry_heap) <= EXPIRY_HEAP_SLACK
+
+    def test_compacted_heap_tracks_every_live_session(self):
+        manager = EnhancedGlobalSessionManager(max_sessions=10)
+        for _ in range(500):
+            manager.create_session()
+        live_entries = {(session.expires_at, session_id) for session_id, session in manager.sessions.items()}
+        assert live_entries <= set(manager._expiry_heap)
+        manager.cleanup_old_sessions()
+        assert len(manager.sessions) == 10
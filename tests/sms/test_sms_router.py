@@ -0,0 +1,300 @@
+"""
+Tests for the SMS router's webhook signature check and background retry queue
+External calls go to httpx mock transports; nothing here talks to Twilio
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from twilio.request_validator import RequestValidator
+
+# Set environment variables before importing the router (config is read at import)
+os.environ.setdefault('EXTERNAL_MESSAGE_API_KEY', 'test-api-key')
+os.environ.setdefault('EXTERNAL_SMS_ENDPOINT', 'http://external.test/api/receive-sms')
+os.environ.setdefault('TWILIO_ACCOUNT_SID', 'AC1234567890123456789012345678901234')
+os.environ.setdefault('TWILIO_AUTH_TOKEN', 'test-auth-token')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import sms.sms_router as sms_router
+
+AUTH_TOKEN = sms_router.config.twilio_auth_token
+WEBHOOK_URL = sms_router.config.webhook_url
+SDK_VALIDATOR = RequestValidator(AUTH_TOKEN)
+
+SAMPLE_FORM = {
+    "AccountSid": "AC1234567890123456789012345678901234",
+    "Body": "Roll for initiative ✨",
+    "From": "+1234567890",
+    "MessageSid": "SM1234567890123456789012345678901234",
+    "NumMedia": "0",
+    "To": "+18005551212"
+}
+
+
+def url_with_port(url):
+    """Add the default port to a URL (Twilio may sign either form)"""
+    scheme, rest = url.split("://", 1)
+    host, path = rest.split("/", 1)
+    return f"{scheme}://{host}:{443 if scheme == 'https' else 80}/{path}"
+
+
+@pytest.fixture
+def router_state(monkeypatch):
+    """Fresh retry queue, dedupe cache and asyncio primitives for every test"""
+    monkeypatch.setattr(sms_router, "retry_heap", [])
+    monkeypatch.setattr(sms_router, "retry_stats", {"retried": 0, "dropped": 0})
+    monkeypatch.setattr(sms_router, "retry_wakeup", asyncio.Event())
+    monkeypatch.setattr(sms_router, "retry_worker_task", None)
+    monkeypatch.setattr(sms_router, "forward_tasks", set())
+    monkeypatch.setattr(sms_router, "FORWARD_SEM", asyncio.Semaphore(sms_router.config.max_inflight))
+    monkeypatch.setattr(sms_router, "processed_messages", sms_router.TTLCache(maxsize=100, ttl=3600))
+    monkeypatch.setattr(sms_router.config, "retry_delay", 0)
+    monkeypatch.setattr(sms_router.config, "max_retries", 0)
+    return sms_router
+
+
+def mock_external(monkeypatch, handler):
+    """Route forwards to handler(request) -> httpx.Response; returns the list of received requests"""
+    requests = []
+
+    def record(request):
+        requests.append(request)
+        return handler(request)
+
+    monkeypatch.setattr(sms_router, "EXTERNAL_HTTP", httpx.AsyncClient(transport=httpx.MockTransport(record)))
+    return requests
+
+
+class TestComputeSignature:
+    """The inline HMAC must produce exactly what Twilio's SDK produces"""
+
+    @pytest.mark.parametrize("url", [
+        WEBHOOK_URL,
+        url_with_port(WEBHOOK_URL),
+        "http://localhost:7860/api/sms/receive",
+        "https://example.com:8443/api/sms/receive?source=twilio"
+    ])
+    def test_matches_sdk(self, url):
+        """Signatures match the SDK for URLs with and without an explicit port"""
+        expected = SDK_VALIDATOR.compute_signature(url, SAMPLE_FORM)
+        assert sms_router.compute_twilio_signature(url, SAMPLE_FORM).decode("utf-8") == expected
+
+    def test_matches_sdk_for_mms_fields(self):
+        """Media fields sort the same way the SDK sorts them"""
+        form = dict(
+            SAMPLE_FORM,
+            NumMedia="2",
+            MediaUrl0="https://api.twilio.com/media/0",
+            MediaContentType0="image/png",
+            MediaUrl1="https://api.twilio.com/media/1",
+            MediaContentType1="video/mp4"
+        )
+        expected = SDK_VALIDATOR.compute_signature(WEBHOOK_URL, form)
+        assert sms_router.compute_twilio_signature(WEBHOOK_URL, form).decode("utf-8") == expected
+
+    def test_empty_form(self):
+        """A form with no fields signs just the URL"""
+        expected = SDK_VALIDATOR.compute_signature(WEBHOOK_URL, {})
+        assert sms_router.compute_twilio_signature(WEBHOOK_URL, {}).decode("utf-8") == expected
+
+
+class TestValidateSignature:
+    """validate_twilio_signature accepts what the SDK accepts for the configured webhook URL"""
+
+    def test_accepts_signature_without_port(self):
+        signature = SDK_VALIDATOR.compute_signature(WEBHOOK_URL, SAMPLE_FORM)
+        assert sms_router.validate_twilio_signature(SAMPLE_FORM, signature)
+        assert SDK_VALIDATOR.validate(WEBHOOK_URL, SAMPLE_FORM, signature)
+
+    def test_accepts_signature_with_port(self):
+        signature = SDK_VALIDATOR.compute_signature(url_with_port(WEBHOOK_URL), SAMPLE_FORM)
+        assert sms_router.validate_twilio_signature(SAMPLE_FORM, signature)
+        assert SDK_VALIDATOR.validate(WEBHOOK_URL, SAMPLE_FORM, signature)
+
+    def test_rejects_tampered_form(self):
+        """Changing any field after signing invalidates the signature"""
+        signature = SDK_VALIDATOR.compute_signature(WEBHOOK_URL, SAMPLE_FORM)
+        tampered = dict(SAMPLE_FORM, Body="Roll for initiative (edited)")
+        assert not sms_router.validate_twilio_signature(tampered, signature)
+
+    def test_rejects_added_field(self):
+        signature = SDK_VALIDATOR.compute_signature(WEBHOOK_URL, SAMPLE_FORM)
+        assert not sms_router.validate_twilio_signature(dict(SAMPLE_FORM, Extra="1"), signature)
+
+    def test_rejects_other_url(self):
+        """A signature for another endpoint doesn't validate here"""
+        signature = SDK_VALIDATOR.compute_signature("https://attacker.example/api/sms/receive", SAMPLE_FORM)
+        assert not sms_router.validate_twilio_signature(SAMPLE_FORM, signature)
+
+    def test_rejects_other_token(self):
+        signature = RequestValidator("some-other-token").compute_signature(WEBHOOK_URL, SAMPLE_FORM)
+        assert not sms_router.validate_twilio_signature(SAMPLE_FORM, signature)
+
+    def test_rejects_missing_signature(self):
+        assert not sms_router.validate_twilio_signature(SAMPLE_FORM, "")
+        assert not sms_router.validate_twilio_signature(SAMPLE_FORM, None)
+
+
+class TestReceiveSignature:
+    """The /receive endpoint enforces the signature outside test mode"""
+
+    @pytest.fixture
+    def client(self, router_state, monkeypatch):
+        monkeypatch.setattr(sms_router.config, "test_mode", False)
+        monkeypatch.setattr(sms_router.config, "use_sdk_validator", False)
+        mock_external(monkeypatch, lambda request: httpx.Response(200))
+        app = FastAPI()
+        app.include_router(sms_router.router, prefix="/api/sms")
+        return TestClient(app)
+
+    def test_valid_signature_is_accepted(self, client):
+        signature = SDK_VALIDATOR.compute_signature(WEBHOOK_URL, SAMPLE_FORM)
+        response = client.post("/api/sms/receive", data=SAMPLE_FORM, headers={"X-Twilio-Signature": signature})
+        assert response.status_code == 202
+
+    def test_tampered_form_is_rejected(self, client):
+        signature = SDK_VALIDATOR.compute_signature(WEBHOOK_URL, SAMPLE_FORM)
+        tampered = dict(SAMPLE_FORM, From="+19999999999")
+        response = client.post("/api/sms/receive", data=tampered, headers={"X-Twilio-Signature": signature})
+        assert response.status_code == 403
+
+    def test_missing_header_is_rejected(self, client):
+        response = client.post("/api/sms/receive", data=SAMPLE_FORM)
+        assert response.status_code == 403
+        assert SAMPLE_FORM["MessageSid"] not in sms_router.processed_messages
+
+
+class TestRetryQueue:
+    """Failed forwards are retried from a bounded heap by the background worker"""
+
+    def queue(self, message_sid="SM1", delay=0.0, timestamp=None):
+        sms_router.schedule_retry({
+            "message_sid": message_sid,
+            "payload": {"message_sid": message_sid},
+            "headers": sms_router.FORWARD_HEADERS,
+            "timestamp": time.monotonic() if timestamp is None else timestamp,
+            "retry_count": 0
+        }, delay)
+
+    def run_worker(self, until, timeout=2.0):
+        """Run the retry worker until until() is true"""
+        async def run():
+            sms_router.start_retry_worker()
+            deadline = time.monotonic() + timeout
+            while not until() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await sms_router.stop_retry_worker()
+        asyncio.run(run())
+
+    def test_queue_rejects_when_full(self, router_state, monkeypatch):
+        monkeypatch.setattr(sms_router, "retry_heap_limit", 1)
+        monkeypatch.setattr(sms_router, "start_retry_worker", lambda: None)
+
+        assert sms_router.queue_failed_message("SM1", {}, {})
+        assert not sms_router.queue_failed_message("SM2", {}, {})
+        assert len(sms_router.retry_heap) == 1
+        assert sms_router.retry_stats["dropped"] == 1
+
+    def test_heap_orders_by_due_time(self, router_state):
+        self.queue("SM_late", delay=60)
+        self.queue("SM_soon", delay=1)
+        assert sms_router.retry_heap[0][2]["message_sid"] == "SM_soon"
+
+    def test_due_retry_succeeds(self, router_state, monkeypatch):
+        requests = mock_external(monkeypatch, lambda request: httpx.Response(200))
+        self.queue("SM1")
+
+        self.run_worker(lambda: sms_router.retry_stats["retried"] == 1)
+
+        assert len(requests) == 1
+        assert sms_router.retry_heap == []
+        assert "forwarded_at" in sms_router.processed_messages["SM1"]
+
+    def test_failed_retry_is_rescheduled_with_backoff(self, router_state, monkeypatch):
+        mock_external(monkeypatch, lambda request: httpx.Response(500))
+        self.queue("SM1")
+
+        self.run_worker(lambda: sms_router.retry_heap and sms_router.retry_heap[0][2]["retry_count"] == 1)
+
+        due, _, message_data = sms_router.retry_heap[0]
+        assert message_data["retry_count"] == 1
+        assert due - time.monotonic() > sms_router.FAILED_RETRY_BASE_DELAY
+
+    def test_rejected_message_is_dropped(self, router_state, monkeypatch):
+        requests = mock_external(monkeypatch, lambda request: httpx.Response(400))
+        self.queue("SM1")
+
+        self.run_worker(lambda: sms_router.retry_stats["dropped"] == 1)
+
+        assert sms_router.retry_stats["dropped"] == 1
+        assert len(requests) == 1
+        assert sms_router.retry_heap == []
+
+    def test_expired_message_is_dropped_without_forwarding(self, router_state, monkeypatch):
+        requests = mock_external(monkeypatch, lambda request: httpx.Response(200))
+        self.queue("SM1", timestamp=time.monotonic() - sms_router.FAILED_MESSAGE_TTL - 1)
+
+        self.run_worker(lambda: sms_router.retry_stats["dropped"] == 1)
+
+        assert sms_router.retry_stats["dropped"] == 1
+        assert requests == []
+
+    def test_due_messages_are_retried_concurrently(self, router_state, monkeypatch):
+        in_flight = {"now": 0, "peak": 0}
+
+        async def slow_ok(request):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            await asyncio.sleep(0.02)
+            in_flight["now"] -= 1
+            return httpx.Response(200)
+
+        monkeypatch.setattr(sms_router, "EXTERNAL_HTTP", httpx.AsyncClient(transport=httpx.MockTransport(slow_ok)))
+        for i in range(sms_router.RETRY_BATCH_SIZE * 2):
+            self.queue(f"SM{i}")
+
+        self.run_worker(lambda: sms_router.retry_stats["retried"] == sms_router.RETRY_BATCH_SIZE * 2)
+
+        assert sms_router.retry_stats["retried"] == sms_router.RETRY_BATCH_SIZE * 2
+        assert 1 < in_flight["peak"] <= sms_router.RETRY_BATCH_SIZE
+
+
+class TestBackpressure:
+    """A full backlog is pushed back to Twilio instead of losing messages"""
+
+    @pytest.fixture
+    def client(self, router_state, monkeypatch):
+        monkeypatch.setattr(sms_router.config, "test_mode", True)
+        app = FastAPI()
+        app.include_router(sms_router.router, prefix="/api/sms")
+        return TestClient(app)
+
+    def test_full_backlog_returns_503(self, client, monkeypatch):
+        requests = mock_external(monkeypatch, lambda request: httpx.Response(200))
+        monkeypatch.setattr(sms_router, "retry_heap_limit", 1)
+        sms_router.retry_heap.append((time.monotonic() + 3600, 0, {"message_sid": "SM_queued"}))
+
+        response = client.post("/api/sms/receive", data=SAMPLE_FORM)
+
+        assert response.status_code == 503
+        assert requests == []
+        assert SAMPLE_FORM["MessageSid"] not in sms_router.processed_messages
+
+    def test_dropped_forward_forgets_sid(self, router_state, monkeypatch):
+        """If the retry queue can't take a failed forward, Twilio's redelivery must not be deduped"""
+        mock_external(monkeypatch, lambda request: httpx.Response(500))
+        monkeypatch.setattr(sms_router, "retry_heap_limit", 0)
+        monkeypatch.setattr(sms_router, "start_retry_worker", lambda: None)
+        message_sid = SAMPLE_FORM["MessageSid"]
+        sms_router.processed_messages[message_sid] = {"accepted_at": "now"}
+
+        asyncio.run(sms_router.forward_and_record(message_sid, {"message_sid": message_sid}, sms_router.FORWARD_HEADERS))
+
+        assert message_sid not in sms_router.processed_messages
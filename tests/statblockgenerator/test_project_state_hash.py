@@ -0,0 +1,242 @@
+"""
+Tests for the save-project unchanged-state skip, ownership checks
+and keeping the internal _stateHash out of API responses
+"""
+
+import asyncio
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+import os
+import sys
+
+# Set environment variables before importing routers
+os.environ.setdefault('GOOGLE_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'test-client-secret')
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# The router pulls in Firestore, Cloudflare and fal clients at import time
+try:
+    import routers.statblockgenerator_router as statblock_router
+    from routers.auth_router import get_current_user
+    from auth_service import User
+except Exception as e:
+    pytest.skip(f"StatBlock router dependencies not available: {e}", allow_module_level=True)
+
+API_PREFIX = "/api/statblockgenerator"
+NOW = "2025-01-01T12:00:00"
+OWNER = User(sub="owner-1", email="owner@example.com", name="Owner")
+
+
+def run_save_transaction(existing, project_data, user_id="owner-1"):
+    """Run the body of _save_project_transaction against a fake snapshot; returns (written, transaction)"""
+    snapshot = MagicMock()
+    snapshot.exists = existing is not None
+    snapshot.to_dict.return_value = existing
+    doc_ref = MagicMock()
+    doc_ref.get.return_value = snapshot
+    transaction = MagicMock()
+    written = statblock_router._save_project_transaction.to_wrap(transaction, doc_ref, project_data, user_id, NOW)
+    return written, transaction
+
+
+def make_project_data(state):
+    return {
+        "id": "sb_proj_1",
+        "createdBy": "owner-1",
+        "updatedAt": NOW,
+        "state": state,
+        "_stateHash": statblock_router._state_hash(state)
+    }
+
+
+class TestStateHash:
+    """Test the hash used to detect unchanged saves"""
+
+    def test_hash_ignores_last_saved(self):
+        """Only lastSaved differs between auto-saves of the same statblock"""
+        state = {"creatureDetails": {"name": "Goblin"}, "lastSaved": "a"}
+        assert statblock_router._state_hash(state) == statblock_router._state_hash(dict(state, lastSaved="b"))
+
+    def test_hash_changes_with_content(self):
+        """Any change to the statblock produces a different hash"""
+        state = {"creatureDetails": {"name": "Goblin"}}
+        assert statblock_router._state_hash(state) != statblock_router._state_hash({"creatureDetails": {"name": "Orc"}})
+
+
+class TestSaveProjectTransaction:
+    """Test the read-check-write done inside the Firestore transaction"""
+
+    def test_new_project_is_written(self):
+        """A project that doesn't exist yet is created with createdAt set to now"""
+        project_data = make_project_data({"creatureDetails": {"name": "Goblin"}})
+
+        written, transaction = run_save_transaction(None, project_data)
+
+        assert written is True
+        assert project_data["createdAt"] == NOW
+        transaction.set.assert_called_once()
+
+    def test_unchanged_state_is_skipped(self):
+        """A save whose state hash matches the stored one writes nothing and keeps stored timestamps"""
+        project_data = make_project_data({"creatureDetails": {"name": "Goblin"}})
+        existing = dict(project_data, createdAt="2024-01-01", updatedAt="2024-06-01")
+
+        written, transaction = run_save_transaction(existing, project_data)
+
+        assert written is False
+        assert project_data["createdAt"] == "2024-01-01"
+        assert project_data["updatedAt"] == "2024-06-01"
+        transaction.set.assert_not_called()
+
+    def test_changed_state_is_written(self):
+        """A save whose state differs from the stored one is written, preserving createdAt"""
+        existing = dict(make_project_data({"creatureDetails": {"name": "Goblin"}}), createdAt="2024-01-01")
+        project_data = make_project_data({"creatureDetails": {"name": "Goblin Boss"}})
+
+        written, transaction = run_save_transaction(existing, project_data)
+
+        assert written is True
+        assert project_data["createdAt"] == "2024-01-01"
+        transaction.set.assert_called_once()
+
+    def test_stored_document_without_hash_is_written(self):
+        """Documents saved before hashing (or edited elsewhere) have no _stateHash and are always written"""
+        project_data = make_project_data({"creatureDetails": {"name": "Goblin"}})
+        existing = {key: value for key, value in project_data.items() if key != "_stateHash"}
+
+        written, transaction = run_save_transaction(existing, project_data)
+
+        assert written is True
+        transaction.set.assert_called_once()
+
+    def test_other_users_project_is_rejected(self):
+        """Saving over another user's project raises 403 and writes nothing, even if the state matches"""
+        project_data = make_project_data({"creatureDetails": {"name": "Goblin"}})
+        existing = dict(project_data, createdBy="someone-else")
+
+        with pytest.raises(HTTPException) as exc_info:
+            run_save_transaction(existing, project_data)
+
+        assert exc_info.value.status_code == 403
+
+    def test_repeated_save_goes_through_transaction(self):
+        """save_project asks Firestore every time rather than trusting a per-process cache"""
+        app = FastAPI()
+        app.include_router(statblock_router.router)
+        app.dependency_overrides[get_current_user] = lambda: OWNER
+        request = {"projectId": "sb_proj_1", "statblock": {"name": "Goblin"}}
+
+        def unchanged(transaction, doc_ref, project_data, user_id, now_iso):
+            project_data["createdAt"] = "2024-01-01"
+            return False
+
+        with patch.object(statblock_router, "db"), \
+             patch.object(statblock_router, "_save_project_transaction", side_effect=unchanged) as save_transaction:
+            client = TestClient(app)
+            assert client.post(f"{API_PREFIX}/save-project", json=request).status_code == 200
+            assert client.post(f"{API_PREFIX}/save-project", json=request).status_code == 200
+
+        assert save_transaction.call_count == 2
+
+
+class TestStateHashNotExposed:
+    """Test that _stateHash stays internal to the Firestore document"""
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+        app.include_router(statblock_router.router)
+        app.dependency_overrides[get_current_user] = lambda: OWNER
+        return TestClient(app)
+
+    @pytest.fixture
+    def stored_project(self):
+        return {
+            "id": "sb_proj_1",
+            "name": "Goblin",
+            "createdBy": "owner-1",
+            "updatedAt": NOW,
+            "state": {"creatureDetails": {"name": "Goblin"}},
+            "_stateHash": "0123456789abcdef"
+        }
+
+    def test_get_project_strips_state_hash(self, client, stored_project):
+        """get_project returns the document without _stateHash and leaves the cached copy intact"""
+        with patch.object(statblock_router, "_get_cached_document", AsyncMock(return_value=stored_project)):
+            response = client.get(f"{API_PREFIX}/project/sb_proj_1")
+
+        assert response.status_code == 200
+        project = response.json()["data"]["project"]
+        assert "_stateHash" not in project
+        assert project["name"] == "Goblin"
+        assert "_stateHash" in stored_project
+
+    def test_list_projects_strips_state_hash(self, client, stored_project):
+        """list_projects returns full documents without _stateHash"""
+        doc = MagicMock()
+        doc.to_dict.return_value = stored_project
+        with patch.object(statblock_router, "db") as db:
+            db.collection.return_value.where.return_value.stream.return_value = [doc]
+            response = client.get(f"{API_PREFIX}/list-projects")
+
+        assert response.status_code == 200
+        projects = response.json()["data"]["projects"]
+        assert len(projects) == 1
+        assert "_stateHash" not in projects[0]
+
+    def test_summary_select_excludes_state_hash(self):
+        """The summary projection never asks Firestore for _stateHash"""
+        assert "_stateHash" not in statblock_router.PROJECT_SUMMARY_FIELDS
+
+
+class TestLoadSessionCache:
+    """Test that load_session hands out copies of the cached session document"""
+
+    def test_mutating_loaded_session_leaves_cache_intact(self):
+        """Changing the dict returned by one load does not leak into the next load"""
+        stored_session = {"session_id": "sess_1", "user_id": OWNER.user_id, "creature_details": {"name": "Goblin"}}
+        snapshot = MagicMock()
+        snapshot.exists = True
+        snapshot.to_dict.return_value = stored_session
+        statblock_router._session_cache.pop("sess_1", None)
+
+        with patch.object(statblock_router, "db") as db:
+            db.collection.return_value.document.return_value.get.return_value = snapshot
+            first = asyncio.run(statblock_router.load_session("sess_1", current_user=OWNER))
+            first["data"]["session"]["user_id"] = "someone-else"
+            first["data"]["session"]["extra"] = True
+            second = asyncio.run(statblock_router.load_session("sess_1", current_user=OWNER))
+
+        statblock_router._session_cache.pop("sess_1", None)
+        assert second["data"]["session"] == {"session_id": "sess_1", "user_id": OWNER.user_id, "creature_details": {"name": "Goblin"}}
+        assert db.collection.return_value.document.return_value.get.call_count == 1
+
+
+class TestListAllImages:
+    """Test the image library aggregated across a user's projects"""
+
+    def test_images_are_deduplicated_and_newest_first(self):
+        """Images shared between projects appear once, sorted by timestamp descending"""
+        app = FastAPI()
+        app.include_router(statblock_router.router)
+        app.dependency_overrides[get_current_user] = lambda: OWNER
+        docs = []
+        for project_id, images in (
+            ("sb_proj_1", [{"id": "a", "url": "https://img/a", "timestamp": "2025-01-01"}]),
+            ("sb_proj_2", [{"id": "b", "url": "https://img/b", "timestamp": "2025-03-01"},
+                           {"id": "a", "url": "https://img/a", "timestamp": "2025-01-01"}]),
+        ):
+            doc = MagicMock()
+            doc.to_dict.return_value = {"id": project_id, "state": {"generatedContent": {"images": images}}}
+            docs.append(doc)
+
+        with patch.object(statblock_router, "db") as db:
+            db.collection.return_value.where.return_value.stream.return_value = docs
+            response = TestClient(app).get(f"{API_PREFIX}/list-all-images")
+
+        assert response.status_code == 200
+        images = response.json()["data"]["images"]
+        assert [image["url"] for image in images] == ["https://img/b", "https://img/a"]
@@ -15,56 +15,11 @@ import sys
 os.environ.setdefault('GOOGLE_CLIENT_ID', 'test-client-id')
 os.environ.setdefault('GOOGLE_CLIENT_SECRET', 'test-client-secret')
 
-# Import the normalization function
-# We'll import it in a way that avoids circular dependencies
-import uuid
-from typing import Dict, Any
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 
-def normalize_statblock_ids(statblock: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Copy of the normalization function for testing
-    This allows us to test the normalization logic without importing the full router
-    """
-    def ensure_id(item: Dict[str, Any]) -> Dict[str, Any]:
-        """Ensure an item has an ID"""
-        if not item.get("id"):
-            item["id"] = str(uuid.uuid4())
-        return item
-    
-    # Normalize actions
-    if "actions" in statblock and isinstance(statblock["actions"], list):
-        statblock["actions"] = [ensure_id(action) for action in statblock["actions"]]
-    
-    # Normalize bonus actions
-    if "bonusActions" in statblock and isinstance(statblock["bonusActions"], list):
-        statblock["bonusActions"] = [ensure_id(action) for action in statblock["bonusActions"]]
-    
-    # Normalize reactions
-    if "reactions" in statblock and isinstance(statblock["reactions"], list):
-        statblock["reactions"] = [ensure_id(reaction) for reaction in statblock["reactions"]]
-    
-    # Normalize special abilities
-    if "specialAbilities" in statblock and isinstance(statblock["specialAbilities"], list):
-        statblock["specialAbilities"] = [ensure_id(ability) for ability in statblock["specialAbilities"]]
-    
-    # Normalize spells
-    if "spells" in statblock and isinstance(statblock["spells"], dict):
-        if "cantrips" in statblock["spells"] and isinstance(statblock["spells"]["cantrips"], list):
-            statblock["spells"]["cantrips"] = [ensure_id(spell) for spell in statblock["spells"]["cantrips"]]
-        if "knownSpells" in statblock["spells"] and isinstance(statblock["spells"]["knownSpells"], list):
-            statblock["spells"]["knownSpells"] = [ensure_id(spell) for spell in statblock["spells"]["knownSpells"]]
-    
-    # Normalize legendary actions
-    if "legendaryActions" in statblock and isinstance(statblock["legendaryActions"], dict):
-        if "actions" in statblock["legendaryActions"] and isinstance(statblock["legendaryActions"]["actions"], list):
-            statblock["legendaryActions"]["actions"] = [ensure_id(action) for action in statblock["legendaryActions"]["actions"]]
-    
-    # Normalize lair actions
-    if "lairActions" in statblock and isinstance(statblock["lairActions"], dict):
-        if "actions" in statblock["lairActions"] and isinstance(statblock["lairActions"]["actions"], list):
-            statblock["lairActions"]["actions"] = [ensure_id(action) for action in statblock["lairActions"]["actions"]]
-    
-    return statblock
+# Import the normalization function
+# It lives outside the router module, so no FastAPI/Firestore setup is needed
+from statblockgenerator._normalize import normalize_statblock_ids
 
 
 class TestIDNormalization: